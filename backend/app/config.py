@@ -0,0 +1,134 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int_list(name: str, default) -> list:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return list(default)
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+# Micro-batching for the ONNX image models
+BATCHING_ENABLED = _env_bool("EDDS_BATCHING_ENABLED", True)
+BATCH_MAX_SIZE = _env_int("EDDS_BATCH_MAX_SIZE", 16)
+BATCH_MAX_WAIT_MS = _env_float("EDDS_BATCH_MAX_WAIT_MS", 5.0)
+
+# Idle float32 input buffers kept for normalizing skin/lung batches in place
+# (one is borrowed per running inference; extra ones are allocated on demand)
+PREPROCESS_BUFFERS = _env_int("EDDS_PREPROCESS_BUFFERS", 4)
+
+# Admission control: per-model limit on concurrently running requests and
+# on requests waiting for a slot; beyond that, requests get 503 + Retry-After
+ADMISSION_ENABLED = _env_bool("EDDS_ADMISSION_ENABLED", True)
+ADMISSION_LIMITS = {
+    "skin": (_env_int("EDDS_SKIN_MAX_CONCURRENCY", 16), _env_int("EDDS_SKIN_MAX_QUEUE", 64)),
+    "lung": (_env_int("EDDS_LUNG_MAX_CONCURRENCY", 16), _env_int("EDDS_LUNG_MAX_QUEUE", 64)),
+    "heart": (_env_int("EDDS_HEART_MAX_CONCURRENCY", 8), _env_int("EDDS_HEART_MAX_QUEUE", 256)),
+}
+# The same, per model, for each bulk or streaming route (/predict_batch, /predict_stream)
+ADMISSION_BULK_LIMITS = (_env_int("EDDS_BULK_MAX_CONCURRENCY", 2), _env_int("EDDS_BULK_MAX_QUEUE", 8))
+
+# Upload ingestion: per-file and per-request byte ceilings
+MAX_UPLOAD_BYTES = _env_int("EDDS_MAX_UPLOAD_BYTES", 20 * 1024 * 1024)
+MAX_BATCH_UPLOAD_BYTES = _env_int("EDDS_MAX_BATCH_UPLOAD_BYTES", 512 * 1024 * 1024)
+MAX_JSON_BODY_BYTES = _env_int("EDDS_MAX_JSON_BODY_BYTES", 16 * 1024 * 1024)
+
+# Image decoding: JPEGs are decoded at the smallest scale that still covers
+# the model input; other formats decode at full size. Images whose decoded
+# size is above MAX_IMAGE_PIXELS are rejected before decoding
+MODEL_INPUT_SIZE = 224
+MAX_IMAGE_PIXELS = _env_int("EDDS_MAX_IMAGE_PIXELS", 40_000_000)
+
+# Bulk image uploads (/predict_batch)
+BULK_MAX_ITEMS = _env_int("EDDS_BULK_MAX_ITEMS", 500)
+BULK_BATCH_SIZE = _env_int("EDDS_BULK_BATCH_SIZE", 32)
+BULK_DECODE_WORKERS = _env_int("EDDS_BULK_DECODE_WORKERS", min(8, os.cpu_count() or 1))
+
+# Heart disease batch scoring
+HEART_BATCH_MAX_RECORDS = _env_int("EDDS_HEART_BATCH_MAX_RECORDS", 10000)
+
+# Streaming CSV/NDJSON heart scoring (/predict_stream, score_heart.py): rows
+# parsed, validated and scored per model call
+HEART_STREAM_CHUNK_ROWS = _env_int("EDDS_HEART_STREAM_CHUNK_ROWS", 4096)
+
+# Background prediction jobs (/api/jobs), persisted in a local SQLite file
+# so queued and partly finished jobs resume after a restart
+JOBS_DB = os.getenv("EDDS_JOBS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.sqlite3"))
+JOB_WORKERS = _env_int("EDDS_JOB_WORKERS", 2)
+JOB_MAX_ITEMS = _env_int("EDDS_JOB_MAX_ITEMS", 10000)
+JOB_MAX_RECORDS = _env_int("EDDS_JOB_MAX_RECORDS", 1000000)
+JOB_POLL_SECONDS = _env_float("EDDS_JOB_POLL_SECONDS", 2.0)
+JOB_LEASE_SECONDS = _env_float("EDDS_JOB_LEASE_SECONDS", 60.0)
+JOB_TTL_SECONDS = _env_float("EDDS_JOB_TTL_SECONDS", 7 * 24 * 3600.0)
+
+# Heart model backend: "onnx" (ONNX Runtime, heart_disease_model.onnx),
+# "xgboost" (the joblib pickle) or "auto" (onnx when the file exists)
+HEART_BACKEND = os.getenv("EDDS_HEART_BACKEND", "auto").strip().lower()
+
+# Warm-up inferences run after startup, per model and batch size, so the
+# first real requests do not pay for ONNX Runtime's lazy setup. GET /ready
+# answers 503 until they finish.
+WARMUP_ENABLED = _env_bool("EDDS_WARMUP_ENABLED", True)
+WARMUP_ROUNDS = _env_int("EDDS_WARMUP_ROUNDS", 3)
+WARMUP_BATCH_SIZES = _env_int_list("EDDS_WARMUP_BATCH_SIZES", [1, BATCH_MAX_SIZE] if BATCHING_ENABLED else [1])
+WARMUP_HEART_BATCH_SIZES = _env_int_list("EDDS_WARMUP_HEART_BATCH_SIZES", [1, HEART_STREAM_CHUNK_ROWS])
+
+# Model registry: "eager" loads every model concurrently at startup,
+# "lazy" loads each one on first use
+MODEL_LOADING = os.getenv("EDDS_MODEL_LOADING", "eager").strip().lower()
+MODELS_DIR = os.getenv("EDDS_MODELS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+
+# Startup profiling: after the models load, print how long each module
+# imported by the app and each model load took (cold-start regressions)
+PROFILE_STARTUP = _env_bool("EDDS_PROFILE_STARTUP", False)
+
+# How often (seconds) model files are re-checked for changes. A changed
+# file is reloaded on next use and its cached predictions are dropped.
+MODEL_CHECK_INTERVAL = _env_float("EDDS_MODEL_CHECK_INTERVAL", 2.0)
+
+# Models loaded once in a pre-fork master (gunicorn --preload, see
+# gunicorn.conf.py) and shared copy-on-write by the workers. Only
+# fork-safe models qualify; the ONNX models use shared_weights instead.
+# Default: the XGBoost pickle, which is "heart" itself on the xgboost
+# backend and "heart_booster" (explanations) when heart is served by ONNX.
+HEART_USES_ONNX = HEART_BACKEND == "onnx" or (
+    HEART_BACKEND == "auto" and os.path.exists(os.path.join(MODELS_DIR, "heart_disease_model.onnx")))
+PRELOAD_MODELS = [name.strip() for name in
+                  os.getenv("EDDS_PRELOAD_MODELS", "heart_booster" if HEART_USES_ONNX else "heart").split(",")
+                  if name.strip()]
+
+# Image model file names inside MODELS_DIR (e.g. an INT8 build from
+# convert_to_onnx.py --quantize)
+SKIN_MODEL_FILE = os.getenv("EDDS_SKIN_MODEL_FILE", "skin_cancer_model.onnx")
+LUNG_MODEL_FILE = os.getenv("EDDS_LUNG_MODEL_FILE", "pneumonia_model.onnx")
+
+# Prediction cache (content-addressed, LRU + TTL)
+CACHE_ENABLED = _env_bool("EDDS_CACHE_ENABLED", True)
+CACHE_MAX_ENTRIES = _env_int("EDDS_CACHE_MAX_ENTRIES", 4096)
+CACHE_MAX_BYTES = _env_int("EDDS_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+CACHE_TTL_SECONDS = _env_float("EDDS_CACHE_TTL_SECONDS", 3600.0)
+
+# Lazily rendered Grad-CAM heatmap artifacts (GET /api/lung/heatmap/{id})
+HEATMAP_MAX_BYTES = _env_int("EDDS_HEATMAP_MAX_BYTES", 128 * 1024 * 1024)
+HEATMAP_TTL_SECONDS = _env_float("EDDS_HEATMAP_TTL_SECONDS", 3600.0)
+
+# ONNX Runtime session profiles: optional JSON file with "default", "skin"
+# and "lung" sections. EDDS_ORT_* and EDDS_<MODEL>_ORT_* variables override it.
+SESSION_PROFILES_FILE = os.getenv("EDDS_SESSION_PROFILES")
@@ -1,23 +1,48 @@
+# Imported first so that, with EDDS_PROFILE_STARTUP, it times every import below
+from app.services.startup_profile import startup_profile, print_startup_profile
+import asyncio
+import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import skin, lung, heart
-
-# Global dictionary to store loaded models
-ml_models = {}
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.routers import skin, lung, heart, jobs
+from app.services.image_service import SKIN_BATCHER, PNEUMONIA_BATCHER
+from app.services.model_registry import registry, process_memory
+from app.services.upload_service import UploadLimitMiddleware
+from app.services.prediction_cache import prediction_cache
+from app.services.preprocessing import preprocess_engine
+from app.services.metrics import metrics, MetricsMiddleware
+from app.services.job_queue import job_queue
+from app.services.admission import AdmissionMiddleware, load_report
+from app.services.warmup import readiness, warm_up, warmup_stop
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup: Load models into memory"""
     print("Loading ML models...")
-    # Models will be loaded here after training
-    ml_models["skin_model"] = None  # Placeholder
-    ml_models["lung_model"] = None  # Placeholder
-    ml_models["heart_model"] = None  # Placeholder
-    print("Models loaded successfully")
+    start = time.perf_counter()
+    await registry.startup()
+    load_seconds = time.perf_counter() - start
+    memory = process_memory()
+    print(f"Model loading finished (pid {memory['pid']}, RSS {memory['rss'] / 2**20:.1f} MB"
+          + (f", PSS {memory['pss'] / 2**20:.1f} MB)" if "pss" in memory else ")"))
+    if startup_profile.enabled:
+        print_startup_profile(registry.status(), load_seconds)
+    await job_queue.start()
+    # Warm-up runs in the background: /health answers at once, /ready once it is done
+    warmup_stop.clear()
+    warmup_task = asyncio.create_task(warm_up())
     yield
-    # Shutdown: Clear memory
-    ml_models.clear()
+    # Shutdown: Stop warm-up and wait for its in-flight inferences, hand running
+    # jobs back to the queue, stop batching queues and clear memory
+    readiness.ready = False
+    warmup_stop.set()
+    await warmup_task
+    await job_queue.stop()
+    await SKIN_BATCHER.close()
+    await PNEUMONIA_BATCHER.close()
+    registry.unload_all()
     print("Models unloaded")
 
 app = FastAPI(
@@ -27,6 +52,17 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Reject oversized uploads before they are buffered (added first so it
+# sits inside CORS and its 413 responses still carry CORS headers)
+app.add_middleware(UploadLimitMiddleware)
+
+# Request/error counters and upload read timing for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Per-model concurrency limits and bounded queues (outside the metrics
+# middleware, so shed requests are counted as rejected, not as errors)
+app.add_middleware(AdmissionMiddleware)
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -40,6 +76,7 @@ app.add_middleware(
 app.include_router(skin.router, prefix="/api/skin", tags=["Skin Cancer"])
 app.include_router(lung.router, prefix="/api/lung", tags=["Pneumonia"])
 app.include_router(heart.router, prefix="/api/heart", tags=["Heart Disease"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Jobs"])
 
 @app.get("/")
 async def root():
@@ -50,9 +87,29 @@ async def root():
 async def health_check():
     return {
         "status": "ok",
-        "models_loaded": {
-            "skin": ml_models.get("skin_model") is not None,
-            "lung": ml_models.get("lung_model") is not None,
-            "heart": ml_models.get("heart_model") is not None
-        }
+        "loading_mode": registry.mode,
+        "models_loaded": {name: registry.is_loaded(name) for name in registry.names()},
+        "models": registry.status(),
+        "process": process_memory(),
+        "cache": prediction_cache.stats(),
+        "preprocess_buffers": preprocess_engine.stats(),
+        "jobs": job_queue.stats(),
+        "admission": load_report()
     }
+
+@app.get("/ready")
+@app.head("/ready")
+async def ready_check():
+    """Readiness for load balancers: 200 once warm-up has finished, 503 before (and during shutdown)"""
+    status = readiness.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/load")
+async def get_load():
+    """Cheap per-model queue depths for load balancers (no model or memory checks)"""
+    return load_report()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text format: per-model, per-stage latency histograms and request/error counters"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
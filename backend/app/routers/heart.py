@@ -1,31 +1,91 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from app.schemas.models import HeartDiseaseInput, PredictionResponse
-from app.services.tabular_service import predict_heart_disease
+import io
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from app.config import HEART_BATCH_MAX_RECORDS
+from app.schemas.models import HeartDiseaseInput, PredictionResponse, BatchPredictionResponse, HEART_FEATURES
+from app.services.model_registry import registry
+from app.services.tabular_service import (
+    predict_heart_disease, predict_heart_disease_batch, score_heart_stream, HEART_MODEL_BACKEND
+)
+from app.services.heart_stream import detect_format
+from app.services.upload_service import spool_request_body
 
 router = APIRouter()
 
 @router.post("/predict", response_model=PredictionResponse)
-async def predict_heart(data: HeartDiseaseInput):
+async def predict_heart(data: HeartDiseaseInput, explain: bool = False,
+                        top_k: int = Query(5, ge=1, le=len(HEART_FEATURES))):
     """
     Heart Disease Prediction Endpoint
-    Accepts: Patient vital signs (JSON)
-    Returns: Risk assessment with SHAP values
+    Accepts: Patient vital signs (JSON); ?explain=true adds SHAP values
+    Returns: Risk assessment, with the top_k signed SHAP contributions when explained
     """
     try:
-        result = await predict_heart_disease(data.model_dump())
+        result = await predict_heart_disease(data.model_dump(), top_k if explain else 0)
         return result
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+@router.post("/predict_batch", response_model=BatchPredictionResponse)
+async def predict_heart_batch(data: List[HeartDiseaseInput], explain: bool = False,
+                              top_k: int = Query(5, ge=1, le=len(HEART_FEATURES))):
+    """
+    Batch Heart Disease Prediction Endpoint
+    Accepts: JSON list of patient records (validated together); ?explain=true adds SHAP values
+    Returns: One risk assessment per record, in input order
+    """
+    if not data:
+        raise HTTPException(status_code=400, detail="At least one record is required")
+    if len(data) > HEART_BATCH_MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"Too many records (max {HEART_BATCH_MAX_RECORDS})")
+    
+    try:
+        results = await predict_heart_disease_batch([record.model_dump() for record in data],
+                                                    top_k if explain else 0)
+        return {
+            "success": all(r["success"] for r in results),
+            "count": len(results),
+            "results": results
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+@router.post("/predict_stream")
+async def predict_heart_stream(request: Request, format: Optional[str] = Query(None, pattern="^(csv|ndjson)$")):
+    """
+    Streaming Heart Disease Scoring Endpoint
+    Accepts: Raw CSV (header row with the feature names) or NDJSON body of any size
+    Returns: One result per input row, streamed in the same format as the input
+    """
+    model = await registry.aget("heart")
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    spool = await spool_request_body(request)
+    fmt = format or detect_format(request.headers.get("content-type"), spool.read(512))
+    spool.seek(0)
+    text = io.TextIOWrapper(spool, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        results = await run_in_threadpool(score_heart_stream, model, text, fmt)
+    except ValueError as e:
+        text.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(results, media_type=media_type, background=BackgroundTask(text.close))
+
 @router.get("/info")
 async def get_heart_info():
     return {
         "model": "XGBoost Classifier",
-        "features": ["age", "sex", "cp", "trestbps", "chol", "fbs", "restecg", 
-                     "thalach", "exang", "oldpeak", "slope", "ca", "thal"],
+        "backend": HEART_MODEL_BACKEND,
+        "features": HEART_FEATURES,
         "output": "Binary (Disease/No Disease)",
-        "explainability": "SHAP values",
-        "status": "ready"
+        "explainability": "TreeSHAP values (opt-in: ?explain=true&top_k=N)",
+        "status": "ready" if registry.is_loaded("heart") else "model not loaded"
     }
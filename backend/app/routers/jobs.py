@@ -0,0 +1,69 @@
+import io
+from typing import List
+from fastapi import APIRouter, File, Form, HTTPException, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from app.config import JOB_MAX_ITEMS, JOB_MAX_RECORDS
+from app.services.heart_stream import detect_format
+from app.services.job_queue import job_queue, image_job_items, heart_job_items, RUNNERS
+from app.services.upload_service import iter_batch_uploads
+
+router = APIRouter()
+
+@router.post("")
+async def create_job(model: str = Form(...), files: List[UploadFile] = File(...)):
+    """
+    Background Prediction Job
+    Accepts: model=skin|lung with image files or a .zip archive, or model=heart with one CSV/NDJSON file
+    Returns: 202 with the job ID; poll GET /api/jobs/{id} for progress and results
+    """
+    if model not in RUNNERS:
+        raise HTTPException(status_code=400, detail=f"model must be one of: {', '.join(RUNNERS)}")
+    
+    if model == "heart":
+        if len(files) != 1:
+            raise HTTPException(status_code=400, detail="Heart jobs take exactly one CSV or NDJSON file")
+        file = files[0]
+        fmt = detect_format(file.content_type, await file.read(512))
+        await file.seek(0)
+        text = io.TextIOWrapper(file.file, encoding="utf-8-sig", errors="replace", newline="")
+        try:
+            job_id, total = await job_queue.submit(model, heart_job_items(text, fmt, JOB_MAX_RECORDS))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            text.detach()
+    else:
+        job_id, total = await job_queue.submit(model, image_job_items(iter_batch_uploads(files, JOB_MAX_ITEMS)))
+    
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "model": model,
+        "total": total,
+        "status_url": f"/api/jobs/{job_id}"
+    })
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(1000, ge=0, le=10000)):
+    """
+    Job Status
+    Returns: Status, progress and up to `limit` results from item `offset` (next_offset when more follow)
+    """
+    job = await run_in_threadpool(job_queue.store.get, job_id, offset, limit)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Cancel a Job
+    Returns: The job's status; a running job stops after its current chunk and keeps finished results
+    """
+    cancelled = await run_in_threadpool(job_queue.store.cancel, job_id)
+    job = await run_in_threadpool(job_queue.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return job
@@ -1,51 +1,107 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from app.services.image_service import process_lung_image
-import io
-from PIL import Image
+from typing import List
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query, Request
+from fastapi.responses import Response
+from app.services.image_service import (
+    process_lung_upload, process_lung_images, lung_supports_cam, render_heatmap, preprocessing_location,
+    HEATMAP_FORMATS, PNEUMONIA_BATCHER
+)
+from app.services.decode_service import ImageTooLarge, ImageDecodeError
+from app.services.upload_service import ingest_upload, read_batch_uploads
+from app.services.model_registry import registry
+from app.services.session_profiles import SESSION_PROFILES
+from app.services.metrics import json_response, timed_threadpool
+from app.services.artifact_store import heatmap_store
 
 router = APIRouter()
 
 @router.post("/predict")
-async def predict_pneumonia(file: UploadFile = File(...)):
+async def predict_pneumonia(file: UploadFile = File(...), heatmap: bool = False, tta: bool = False):
     """
     Pneumonia Detection Endpoint
-    Accepts: Chest X-Ray image
-    Returns: Prediction (Normal/Bacterial/Viral) with heatmap
+    Accepts: Chest X-Ray image (?heatmap=true to also produce a Grad-CAM heatmap,
+             ?tta=true to average flipped/rotated views)
+    Returns: Prediction (Normal/Pneumonia), plus heatmap_id/heatmap_url when requested
     """
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    # Size limit + magic-byte sniffing before anything is decoded
+    source = await ingest_upload(file)
     
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        result = await process_lung_upload(source, heatmap=heatmap, tta=tta)
         
-        result = await process_lung_image(image)
-        
-        return JSONResponse(content=result)
+        return json_response("lung", result)
     
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"ERROR in predict_pneumonia: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+@router.post("/predict_batch")
+async def predict_pneumonia_batch(files: List[UploadFile] = File(...)):
+    """
+    Bulk Pneumonia Detection Endpoint
+    Accepts: Many chest X-ray files, or a single .zip archive of images
+    Returns: One prediction per image, in upload order (no heatmaps)
+    """
+    items = await read_batch_uploads(files)
+    
+    try:
+        results = await process_lung_images(items)
+        
+        return json_response("lung", {
+            "success": all(r["success"] for r in results),
+            "count": len(results),
+            "results": results
+        })
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+@router.get("/heatmap/{heatmap_id}")
+async def get_heatmap(heatmap_id: str, request: Request, fmt: str = Query("png", alias="format")):
+    """
+    Grad-CAM Heatmap Artifact
+    Returns: The overlay as PNG or WebP bytes, rendered on first request and cached
+    """
+    if fmt not in HEATMAP_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(HEATMAP_FORMATS)}")
+    if not heatmap_store.contains(heatmap_id):
+        raise HTTPException(status_code=404, detail="Heatmap not found or expired")
+    
+    # Artifacts never change, so the ID + format is a strong validator
+    etag = f'"{heatmap_id}.{fmt}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(heatmap_store.ttl)}, immutable"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    content = await timed_threadpool("lung", heatmap_store.render, heatmap_id, fmt, render_heatmap)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Heatmap not found or expired")
+    return Response(content=content, media_type=HEATMAP_FORMATS[fmt], headers=headers)
+
 @router.get("/test")
 async def test_model():
     """Test if model is loaded"""
-    from app.services.image_service import PNEUMONIA_SESSION
-    if PNEUMONIA_SESSION:
+    if await registry.aget("lung"):
         return {"status": "Model loaded", "ready": True}
     else:
         return {"status": "Model not found", "ready": False}
 
 @router.get("/info")
 async def get_lung_info():
-    from app.services.image_service import PNEUMONIA_SESSION
+    session = await registry.aget("lung")
     return {
         "model": "MobileNetV3",
         "classes": ["Normal", "Bacterial Pneumonia", "Viral Pneumonia"],
         "input_size": "224x224",
         "features": ["Grad-CAM heatmap"],
-        "status": "ready" if PNEUMONIA_SESSION else "model not loaded"
+        "preprocessing": preprocessing_location(session) if session else None,
+        "gradcam": "blocks[-1] activations" if session and lung_supports_cam(session) else "unavailable (re-export the model with Grad-CAM outputs)",
+        "session_profile": SESSION_PROFILES["lung"],
+        "batching": PNEUMONIA_BATCHER.stats(),
+        "status": "ready" if session else "model not loaded"
     }
@@ -1,40 +1,71 @@
+from typing import List
 from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from app.services.image_service import process_skin_image
-import io
-from PIL import Image
+from app.services.image_service import (
+    process_skin_upload, process_skin_images, preprocessing_location, SKIN_BATCHER
+)
+from app.services.decode_service import ImageTooLarge, ImageDecodeError
+from app.services.upload_service import ingest_upload, read_batch_uploads
+from app.services.model_registry import registry
+from app.services.session_profiles import SESSION_PROFILES
+from app.services.metrics import json_response
 
 router = APIRouter()
 
 @router.post("/predict")
-async def predict_skin_cancer(file: UploadFile = File(...)):
+async def predict_skin_cancer(file: UploadFile = File(...), tta: bool = False):
     """
     Skin Cancer Detection Endpoint
-    Accepts: JPEG/PNG image of skin lesion
-    Returns: Prediction with confidence score
+    Accepts: JPEG/PNG image of skin lesion (?tta=true to average flipped/rotated views)
+    Returns: Prediction with confidence score, plus view agreement with TTA
     """
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    # Size limit + magic-byte sniffing before anything is decoded
+    source = await ingest_upload(file)
     
     try:
-        # Read image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        # Decode straight from the spooled upload (no extra copy) and
+        # process (preprocessing + inference), unless the result is cached
+        result = await process_skin_upload(source, tta=tta)
         
-        # Process image (preprocessing + inference)
-        result = await process_skin_image(image)
+        return json_response("skin", result)
+    
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+@router.post("/predict_batch")
+async def predict_skin_cancer_batch(files: List[UploadFile] = File(...)):
+    """
+    Bulk Skin Cancer Detection Endpoint
+    Accepts: Many image files, or a single .zip archive of images
+    Returns: One prediction per image, in upload order
+    """
+    items = await read_batch_uploads(files)
+    
+    try:
+        results = await process_skin_images(items)
         
-        return JSONResponse(content=result)
+        return json_response("skin", {
+            "success": all(r["success"] for r in results),
+            "count": len(results),
+            "results": results
+        })
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
 @router.get("/info")
 async def get_skin_info():
+    session = registry.get("skin") if registry.is_loaded("skin") else None
     return {
         "model": "EfficientNetV2-Small",
         "classes": ["Melanoma", "Nevus", "Basal Cell Carcinoma", "Actinic Keratosis", 
                     "Benign Keratosis", "Dermatofibroma", "Vascular Lesion", "Squamous Cell Carcinoma"],
         "input_size": "224x224",
-        "status": "ready"
+        "preprocessing": preprocessing_location(session) if session else None,
+        "session_profile": SESSION_PROFILES["skin"],
+        "batching": SKIN_BATCHER.stats(),
+        "status": "ready" if registry.is_loaded("skin") else "model not loaded"
     }
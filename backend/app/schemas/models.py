@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 class HeartDiseaseInput(BaseModel):
     age: int = Field(..., ge=1, le=120, description="Age in years")
@@ -16,8 +16,16 @@ class HeartDiseaseInput(BaseModel):
     ca: int = Field(..., ge=0, le=4, description="Number of major vessels colored by fluoroscopy (0-4)")
     thal: int = Field(..., ge=0, le=7, description="Thalassemia (0-7)")
 
+# Fixed feature order the heart model was trained on
+HEART_FEATURES = list(HeartDiseaseInput.model_fields)
+
 class PredictionResponse(BaseModel):
     success: bool
     prediction: str
     confidence: float
     details: Optional[dict] = None
+
+class BatchPredictionResponse(BaseModel):
+    success: bool
+    count: int
+    results: List[PredictionResponse]
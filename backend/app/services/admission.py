@@ -0,0 +1,163 @@
+import asyncio
+import math
+from collections import deque
+from time import perf_counter_ns
+from fastapi import HTTPException
+from app.config import ADMISSION_ENABLED, ADMISSION_LIMITS, ADMISSION_BULK_LIMITS
+from app.services.metrics import metrics, PREDICT_MODELS
+
+
+class Overloaded(Exception):
+    def __init__(self, model, route, retry_after):
+        super().__init__(f"{model} model is overloaded ({route}); retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limit plus a bounded FIFO wait queue for one model route.
+
+    Up to `max_concurrency` requests run at once, up to `max_queue` more
+    wait for a slot in arrival order, and anything beyond that is rejected
+    immediately with a Retry-After estimate: the time the current backlog
+    needs to drain, from an exponentially weighted moving average of how
+    long admitted requests held their slot.
+    """
+
+    def __init__(self, model, route, max_concurrency, max_queue, alpha=0.2):
+        self.model = model
+        self.route = route
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.alpha = alpha
+        self.active = 0
+        self.rejected = 0
+        self.service_seconds = None  # EWMA
+        self._waiters = deque()
+
+    def retry_after(self):
+        """Whole seconds (>= 1) until the running and queued requests should have drained"""
+        backlog = self.active + len(self._waiters)
+        estimate = (self.service_seconds or 1.0) * backlog / self.max_concurrency
+        return max(1, math.ceil(estimate))
+
+    async def acquire(self):
+        """Take a slot, waiting in the queue if needed; raises Overloaded when the queue is full"""
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            metrics.rejected[(self.model, self.route)] += 1
+            raise Overloaded(self.model, self.route, self.retry_after())
+
+        start = perf_counter_ns()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._publish()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self.release()
+            else:
+                self._waiters.remove(future)
+                self._publish()
+            raise
+        metrics.observe(self.model, "admission_wait", start)
+
+    def release(self, held_seconds=None):
+        """Free a slot (handing it straight to the next waiter) and update the service time average"""
+        if held_seconds is not None:
+            if self.service_seconds is None:
+                self.service_seconds = held_seconds
+            else:
+                self.service_seconds += self.alpha * (held_seconds - self.service_seconds)
+
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+    def _publish(self):
+        metrics.inflight[(self.model, self.route)] = self.active
+        metrics.queued[(self.model, self.route)] = len(self._waiters)
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "service_ms": round(self.service_seconds * 1000.0, 3) if self.service_seconds is not None else None,
+            "retry_after": self.retry_after(),
+        }
+
+
+# (model, route) -> controller. Single predictions share the per-model
+# limits; each model's bulk and streaming routes get their own, smaller
+# limiter, so long uploads neither take /predict slots nor skew its
+# service time average.
+BULK_ROUTES = {"skin": ("predict_batch",), "lung": ("predict_batch",), "heart": ("predict_batch", "predict_stream")}
+ADMISSION = {(name, "predict"): AdmissionController(name, "predict", *ADMISSION_LIMITS[name]) for name in PREDICT_MODELS}
+ADMISSION.update({(name, route): AdmissionController(name, route, *ADMISSION_BULK_LIMITS)
+                  for name in PREDICT_MODELS for route in BULK_ROUTES[name]})
+
+
+def load_report():
+    """Per-model load for load balancers: running/queued requests and whether new ones would be shed"""
+    models = {name: ADMISSION[(name, "predict")].stats() for name in PREDICT_MODELS}
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "saturated": [name for name, s in models.items() if s["waiting"] >= s["max_queue"] and
+                      s["active"] >= s["max_concurrency"]],
+        "models": models,
+        "bulk": {f"{name}/{route}": controller.stats() for (name, route), controller in ADMISSION.items()
+                 if route != "predict"},
+    }
+
+
+class AdmissionMiddleware:
+    """
+    Applies the AdmissionController of each POST /api/<model>/<route>.
+    The slot is taken once the request body has arrived, so slow uploads
+    hold none, and is held until the response (including a streamed one)
+    has been sent, so one model's burst cannot take over the shared
+    threadpool that the other models need.
+    """
+
+    def __init__(self, app, controllers=ADMISSION, enabled=ADMISSION_ENABLED):
+        self.app = app
+        self.controllers = controllers
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        parts = scope["path"].split("/") if scope["type"] == "http" and scope["method"] == "POST" else []
+        controller = self.controllers.get((parts[2], parts[3])) if len(parts) == 4 and parts[1] == "api" else None
+        if not self.enabled or controller is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+
+        async def admitted_receive():
+            nonlocal start
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False) and start is None:
+                try:
+                    await controller.acquire()
+                except Overloaded as e:
+                    raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+                start = perf_counter_ns()
+            return message
+
+        try:
+            await self.app(scope, admitted_receive, send)
+        finally:
+            if start is not None:
+                controller.release((perf_counter_ns() - start) / 1e9)
@@ -0,0 +1,82 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from app.config import HEATMAP_MAX_BYTES, HEATMAP_TTL_SECONDS
+
+
+class ArtifactStore:
+    """
+    Bounded LRU + TTL store for heatmap artifacts.
+
+    An artifact keeps only the inputs needed to draw it (the 224x224 image
+    and the low-resolution CAM). Encoded images are rendered on first
+    request per format and kept alongside, so each format is encoded once.
+    Artifacts are immutable, which lets their ID double as an ETag.
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024, ttl_seconds=3600.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._items = OrderedDict()  # id -> {"expires_at", "inputs", "rendered", "size"}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, *inputs):
+        """Store render inputs (numpy arrays) and return a new artifact ID"""
+        artifact_id = uuid.uuid4().hex
+        size = sum(a.nbytes for a in inputs)
+        with self._lock:
+            self._items[artifact_id] = {
+                "expires_at": time.monotonic() + self.ttl,
+                "inputs": inputs,
+                "rendered": {},
+                "size": size,
+            }
+            self._bytes += size
+            self._evict()
+        return artifact_id
+
+    def contains(self, artifact_id):
+        return self._get(artifact_id) is not None
+
+    def _get(self, artifact_id):
+        with self._lock:
+            item = self._items.get(artifact_id)
+            if item is None:
+                return None
+            if item["expires_at"] < time.monotonic():
+                self._remove(artifact_id)
+                return None
+            self._items.move_to_end(artifact_id)
+            return item
+
+    def render(self, artifact_id, fmt, renderer):
+        """Encoded bytes for `fmt`, rendering with renderer(*inputs, fmt) on first use"""
+        item = self._get(artifact_id)
+        if item is None:
+            return None
+        encoded = item["rendered"].get(fmt)
+        if encoded is None:
+            encoded = renderer(*item["inputs"], fmt)
+            with self._lock:
+                if artifact_id in self._items:
+                    item["rendered"][fmt] = encoded
+                    item["size"] += len(encoded)
+                    self._bytes += len(encoded)
+                    self._evict()
+        return encoded
+
+    def _remove(self, artifact_id):
+        item = self._items.pop(artifact_id)
+        self._bytes -= item["size"]
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            self._remove(next(iter(self._items)))
+
+    def stats(self):
+        return {"artifacts": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes, "ttl_seconds": self.ttl}
+
+
+heatmap_store = ArtifactStore(max_bytes=HEATMAP_MAX_BYTES, ttl_seconds=HEATMAP_TTL_SECONDS)
@@ -0,0 +1,156 @@
+import asyncio
+from collections import Counter
+from time import perf_counter_ns
+import numpy as np
+from app.services.metrics import metrics, timed_threadpool
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching queue in front of one model.
+
+    Requests are collected until `max_batch_size` rows are pending or the
+    oldest one has waited `max_wait_ms`, then run as a single batched
+    inference. Each caller gets back its own rows of every model output.
+    """
+
+    def __init__(self, name, run_batch, max_batch_size=16, max_wait_ms=5.0, enabled=True):
+        self.name = name
+        self.run_batch = run_batch  # callable(np.ndarray) -> list of np.ndarray outputs
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.enabled = enabled
+
+        self.histogram = Counter()
+        self.requests = 0
+        self.batches = 0
+
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._carry = None
+        self._inflight = []
+
+    async def submit(self, inputs: np.ndarray):
+        """Queue a (N, ...) input tensor and wait for its rows of each output"""
+        self.requests += 1
+        if not self.enabled:
+            outputs = await timed_threadpool(self.name, self._run_timed, inputs)
+            self._record(len(inputs))
+            return outputs
+
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((inputs, future))
+        return await future
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (e.g. app restarted in tests)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._carry = None
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            else:
+                first = await self._queue.get()
+
+            pending = [first]
+            rows = len(first[0])
+            deadline = loop.time() + self.max_wait
+
+            while rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout <= 0:
+                        item = self._queue.get_nowait()
+                    else:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+
+                if rows + len(item[0]) > self.max_batch_size:
+                    # Keep it for the next batch instead of overshooting
+                    self._carry = item
+                    break
+                pending.append(item)
+                rows += len(item[0])
+
+            self._inflight = pending
+            await self._dispatch(pending, rows)
+            self._inflight = []
+
+    async def _dispatch(self, pending, rows):
+        if len(pending) == 1:
+            inputs = pending[0][0]
+        else:
+            inputs = np.concatenate([item[0] for item in pending], axis=0)
+
+        try:
+            outputs = await timed_threadpool(self.name, self._run_timed, inputs)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._record(rows)
+
+        # Fan the batched outputs back out to the waiting requests
+        start = 0
+        for item_inputs, future in pending:
+            end = start + len(item_inputs)
+            if not future.done():
+                future.set_result([output[start:end] for output in outputs])
+            start = end
+
+    def _run_timed(self, inputs):
+        start = perf_counter_ns()
+        outputs = self.run_batch(inputs)
+        metrics.observe(self.name, "inference", start)
+        return outputs
+
+    def _record(self, rows):
+        self.batches += 1
+        self.histogram[rows] += 1
+
+    async def close(self):
+        """Stop the worker and fail anything still waiting"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._worker = None
+
+        leftovers = list(self._inflight)
+        self._inflight = []
+        if self._carry is not None:
+            leftovers.append(self._carry)
+            self._carry = None
+        while self._queue is not None and not self._queue.empty():
+            leftovers.append(self._queue.get_nowait())
+        for _, future in leftovers:
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} batcher stopped"))
+
+    def stats(self):
+        total_rows = sum(size * count for size, count in self.histogram.items())
+        return {
+            "enabled": self.enabled,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": round(total_rows / self.batches, 3) if self.batches else 0.0,
+            "batch_size_histogram": {str(size): self.histogram[size] for size in sorted(self.histogram)},
+        }
@@ -0,0 +1,64 @@
+import io
+import time
+from PIL import Image
+from app.config import MODEL_INPUT_SIZE, MAX_IMAGE_PIXELS
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class ImageDecodeError(ValueError):
+    pass
+
+
+# Modes Image.reduce() cannot handle, converted to what the models read
+# them as anyway. Other unsupported modes (e.g. 16-bit "I;16") skip the
+# reduction and are only resized later, as before.
+REDUCE_CONVERSIONS = {"1": "L", "P": "RGB", "PA": "RGBA"}
+
+
+def decode_image(source, target_size=MODEL_INPUT_SIZE, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode an upload at the smallest scale that is still >= target_size.
+
+    JPEGs are decoded with DCT scaling via `draft()` (1/2, 1/4 or 1/8), so a
+    12 MP photo never materialises at full size. PIL has no scaled decode
+    for other formats (PNG, WebP, ...): they are decoded at full size and
+    then box-reduced by an integer factor, so for them the memory bound is
+    `max_pixels` itself, not the model input size. Every format's decoded
+    size (the drafted size for JPEG, the header size otherwise) is checked
+    against `max_pixels` before any pixels are read.
+
+    `source` is bytes or a binary file object. Returns (image, decode_ms).
+    """
+    start = time.perf_counter()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    
+    try:
+        image = Image.open(source)
+        if image.format == "JPEG":
+            image.draft(image.mode, (target_size, target_size))
+        
+        # Header dimensions, known before load() for every format
+        width, height = image.size
+        if width * height > max_pixels:
+            raise ImageTooLarge(f"Image is {width}x{height}; the limit is {max_pixels} pixels")
+        
+        image.load()
+        
+        factor = min(image.width // target_size, image.height // target_size)
+        if factor >= 2:
+            if image.mode in REDUCE_CONVERSIONS:
+                image = image.convert(REDUCE_CONVERSIONS[image.mode])
+            try:
+                image = image.reduce(factor)
+            except ValueError:
+                pass  # "image has wrong mode"
+    except ImageTooLarge:
+        raise
+    except Exception as e:
+        raise ImageDecodeError(f"Could not decode image: {str(e)}") from e
+    
+    return image, (time.perf_counter() - start) * 1000.0
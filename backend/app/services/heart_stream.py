@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+from itertools import islice
+from time import perf_counter_ns
+import numpy as np
+from app.schemas.models import HeartDiseaseInput, HEART_FEATURES
+from app.services.metrics import metrics
+
+# Per-feature bounds and integer columns from the HeartDiseaseInput schema,
+# so a whole chunk is validated with a few array comparisons
+_FIELDS = list(HeartDiseaseInput.model_fields.values())
+LOW = np.array([next(m.ge for m in f.metadata if hasattr(m, "ge")) for f in _FIELDS], dtype=np.float64)
+HIGH = np.array([next(m.le for m in f.metadata if hasattr(m, "le")) for f in _FIELDS], dtype=np.float64)
+INTEGER_COLUMNS = np.array([f.annotation is int for f in _FIELDS])
+
+FORMATS = ("csv", "ndjson")
+CSV_COLUMNS = ["row", "prediction", "confidence", "risk_percentage", "error"]
+
+
+def detect_format(content_type, head: bytes):
+    """"csv" or "ndjson", from the Content-Type or else the first non-blank byte"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"):
+        return "ndjson"
+    return "ndjson" if head.lstrip().startswith(b"{") else "csv"
+
+
+def _row_floats(cells):
+    """Slow path for a chunk numpy could not convert at once: NaN for each bad cell"""
+    try:
+        return [float(cell) for cell in cells]
+    except (TypeError, ValueError):
+        pass
+    values = []
+    for cell in cells:
+        try:
+            values.append(float(cell))
+        except (TypeError, ValueError):
+            values.append(np.nan)
+    return values
+
+
+def _to_matrix(rows):
+    """(N, 13) float64 matrix; missing or non-numeric cells become NaN"""
+    try:
+        return np.array(rows, dtype=np.float64).reshape(len(rows), len(HEART_FEATURES))
+    except (TypeError, ValueError):
+        return np.array([_row_floats(row) for row in rows], dtype=np.float64).reshape(len(rows), len(HEART_FEATURES))
+
+
+class RecordChunks:
+    """
+    Reads patient records from a CSV (with a header row) or NDJSON text
+    stream in chunks of `chunk_rows`. Each chunk is an (N, 13) float64 matrix
+    in HeartDiseaseInput column order plus a per-row error (None if the row
+    parsed), so memory stays bounded by the chunk size, not the file size.
+    CSV columns are matched by header name; extra columns are ignored.
+    """
+
+    def __init__(self, text, fmt, chunk_rows):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+        self.fmt = fmt
+        self.chunk_rows = max(1, chunk_rows)
+        if fmt == "ndjson":
+            self.rows = (line for line in text if line.strip())
+            return
+
+        self.rows = csv.reader(text)
+        header = [name.strip().lower() for name in next(self.rows, [])]
+        missing = [name for name in HEART_FEATURES if name not in header]
+        if missing:
+            raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+        self.columns = [header.index(name) for name in HEART_FEATURES]
+        self.width = len(header)
+
+    def _parse_csv(self, rows):
+        errors = [None] * len(rows)
+        cells = []
+        for i, row in enumerate(rows):
+            if len(row) != self.width:
+                errors[i] = f"expected {self.width} columns, got {len(row)}"
+                cells.append([None] * len(HEART_FEATURES))
+            else:
+                cells.append([row[c] for c in self.columns])
+        return _to_matrix(cells), errors
+
+    def _parse_ndjson(self, lines):
+        errors = [None] * len(lines)
+        cells = []
+        for i, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+                cells.append([record.get(name) for name in HEART_FEATURES])
+            except (ValueError, AttributeError):
+                errors[i] = "not a JSON object"
+                cells.append([None] * len(HEART_FEATURES))
+        return _to_matrix(cells), errors
+
+    def __iter__(self):
+        parse = self._parse_csv if self.fmt == "csv" else self._parse_ndjson
+        while True:
+            rows = list(islice(self.rows, self.chunk_rows))
+            if not rows:
+                return
+            start = perf_counter_ns()
+            values, errors = parse(rows)
+            metrics.observe("heart", "preprocess", start)
+            yield values, errors
+
+
+def validate(values, errors):
+    """
+    Vectorized schema check of one chunk. Returns the boolean mask of valid
+    rows and fills `errors` in place for the rows that fail.
+    """
+    start = perf_counter_ns()
+    with np.errstate(invalid="ignore"):
+        bad = ~((values >= LOW) & (values <= HIGH))
+        bad[:, INTEGER_COLUMNS] |= values[:, INTEGER_COLUMNS] != np.floor(values[:, INTEGER_COLUMNS])
+    parsed = np.array([e is None for e in errors])
+    valid = parsed & ~bad.any(axis=1)
+
+    first_bad = np.argmax(bad, axis=1)
+    for i in np.flatnonzero(parsed & ~valid):
+        j = first_bad[i]
+        kind = "an integer" if INTEGER_COLUMNS[j] else "a number"
+        errors[i] = f"{HEART_FEATURES[j]} must be {kind} between {LOW[j]:g} and {HIGH[j]:g}"
+    metrics.observe("heart", "validate", start)
+    return valid
+
+
+def score_chunk(model, values, errors, score):
+    """
+    Validate and score one chunk with a single model call. Returns one
+    (prediction, confidence, risk_percentage, error) tuple per row.
+    """
+    valid = validate(values, errors)
+    rows = [("Invalid Input", 0.0, None, error) for error in errors]
+    if valid.any():
+        proba, labels = score(model, values[valid].astype(np.float32))
+        start = perf_counter_ns()
+        for i, p, label in zip(np.flatnonzero(valid), proba.tolist(), labels.tolist()):
+            rows[i] = ("Low Risk" if label == 0 else "High Risk", max(p), round(p[1] * 100, 2), None)
+        metrics.observe("heart", "postprocess", start)
+    metrics.invalid_inputs["heart"] += len(rows) - int(valid.sum())
+    return rows
+
+
+def row_result(n, row):
+    """Result dict for scored row number `n`"""
+    prediction, confidence, risk, error = row
+    result = {"row": n, "success": error is None, "prediction": prediction, "confidence": confidence}
+    result.update({"risk_percentage": risk} if error is None else {"error": error})
+    return result
+
+
+def format_rows(rows, first_row, fmt, header=False):
+    """Serialize scored rows (numbered from `first_row`) as CSV or NDJSON text"""
+    if fmt == "ndjson":
+        lines = [json.dumps(row_result(n, row)) for n, row in enumerate(rows, first_row)]
+        return "\n".join(lines) + "\n"
+
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    writer.writerows((n, *row) for n, row in enumerate(rows, first_row))
+    return out.getvalue()
+
+
+def score_stream(model, text, fmt, chunk_rows, score):
+    """
+    Score a CSV/NDJSON text stream chunk by chunk, yielding the results as
+    text in the same format. The input is opened (and a bad CSV header
+    reported as ValueError) before the first chunk is read.
+    """
+    chunks = RecordChunks(text, fmt, chunk_rows)
+
+    def _results():
+        first_row = 1
+        for values, errors in chunks:
+            rows = score_chunk(model, values, errors, score)
+            yield format_rows(rows, first_row, fmt, header=first_row == 1)
+            first_row += len(rows)
+
+    return _results()
@@ -1,23 +1,57 @@
 from PIL import Image
 import numpy as np
-from fastapi.concurrency import run_in_threadpool
-import onnxruntime as ort
 from pathlib import Path
-import base64
-import io
-import cv2
-
-# Load skin cancer model
-SKIN_MODEL_PATH = Path("app/models/skin_cancer_model.onnx")
-SKIN_SESSION = None
-
-try:
-    if SKIN_MODEL_PATH.exists():
-        SKIN_SESSION = ort.InferenceSession(str(SKIN_MODEL_PATH))
-        print("Skin cancer ONNX model loaded")
-except Exception as e:
-    print(f"WARNING: ONNX not found, will use PyTorch: {e}")
-    SKIN_SESSION = None
+from time import perf_counter_ns
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import asyncio
+from app.config import (
+    BATCHING_ENABLED, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+    BULK_BATCH_SIZE, BULK_DECODE_WORKERS, SKIN_MODEL_FILE, LUNG_MODEL_FILE
+)
+from app.services.batching import MicroBatcher
+from app.services.session_profiles import load_onnx_session, SESSION_PROFILES
+from app.services.model_registry import registry, MODELS_PATH
+from app.services.decode_service import decode_image
+from app.services.upload_service import UploadRejected, upload_digest
+from app.services.prediction_cache import prediction_cache
+from app.services.artifact_store import heatmap_store
+from app.services.metrics import metrics, timed_threadpool
+from app.services.preprocessing import preprocess_engine
+
+def _session_loader(model_name):
+    """Registry loader that builds the session with the model's ORT profile"""
+    def _load(path: Path):
+        return load_onnx_session(path, SESSION_PROFILES[model_name])
+    return _load
+
+def takes_pixels(session):
+    """True for an export with preprocessing folded into the graph (convert_to_onnx.py --fold-preprocessing)"""
+    return session.get_inputs()[0].type == "tensor(uint8)"
+
+def preprocessing_location(session):
+    """Where a loaded image model's normalization runs, for /api/*/info"""
+    return "onnx graph (uint8 NHWC input)" if takes_pixels(session) else "python (float32 NCHW input)"
+
+@contextmanager
+def model_input(session, pixels, model_name):
+    """
+    Requests are preprocessed to (N, 224, 224, 3) uint8 pixels and batched
+    as such. A model with folded preprocessing takes them as they are; any
+    other gets them normalized into a (N, 3, 224, 224) float32 tensor here,
+    once per batch, in a pooled buffer that is valid until the block exits.
+    """
+    if takes_pixels(session):
+        yield pixels
+        return
+    start = perf_counter_ns()
+    with preprocess_engine.normalized(pixels) as tensor:
+        metrics.observe(model_name, "normalize", start)
+        yield tensor
+
+# Skin cancer model (loaded by the registry at startup or on first use)
+SKIN_MODEL_PATH = MODELS_PATH / SKIN_MODEL_FILE
+registry.register("skin", SKIN_MODEL_PATH, _session_loader("skin"))
 
 # Skin cancer class names (ISIC 2019)
 SKIN_CLASSES = [
@@ -42,134 +76,254 @@ SKIN_CLASS_INFO = {
     "Squamous Cell Carcinoma": {"severity": "High", "type": "Malignant", "color": "red"}
 }
 
-async def process_skin_image(image: Image.Image):
-    """Preprocess and predict skin cancer"""
-    def _inference():
-        # Preprocessing (same as training)
-        img = image.convert("RGB").resize((224, 224))
-        img_array = np.array(img, dtype=np.float32) / 255.0
-        
-        # Normalize (ImageNet stats)
-        mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
-        std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
-        img_array = (img_array - mean) / std
-        
-        # Convert to CHW format
-        img_array = np.transpose(img_array, (2, 0, 1))
-        img_array = np.expand_dims(img_array, axis=0).astype(np.float32)
-        
-        if SKIN_SESSION:
-            try:
-                # ONNX inference
-                outputs = SKIN_SESSION.run(None, {'input': img_array})
-                logits = outputs[0][0]
-                
-                # Softmax
-                exp_logits = np.exp(logits - np.max(logits))
-                probs = exp_logits / np.sum(exp_logits)
-                
-                pred_class = int(np.argmax(probs))
-                confidence = float(probs[pred_class])
-                prediction = SKIN_CLASSES[pred_class]
-                
-                # Get class info
-                class_info = SKIN_CLASS_INFO[prediction]
-                
-                # Build probabilities dict
-                prob_dict = {SKIN_CLASSES[i]: float(probs[i]) for i in range(len(SKIN_CLASSES))}
-                
-                # Recommendations
-                if class_info["type"] == "Malignant":
-                    recommendation = "URGENT: Consult a dermatologist immediately for biopsy"
-                    next_steps = [
-                        "Schedule dermatologist appointment ASAP",
-                        "Get professional biopsy examination",
-                        "Do not delay treatment"
-                    ]
-                elif class_info["type"] == "Pre-cancerous":
-                    recommendation = "CAUTION: Medical evaluation recommended"
-                    next_steps = [
-                        "Consult dermatologist within 1-2 weeks",
-                        "Monitor for changes",
-                        "Consider preventive treatment"
-                    ]
-                else:
-                    recommendation = "Likely benign, but monitor for changes"
-                    next_steps = [
-                        "Regular self-examination",
-                        "Annual dermatology checkup",
-                        "Watch for size/color changes"
-                    ]
-                
-                return {
-                    "success": True,
-                    "prediction": prediction,
-                    "confidence": confidence,
-                    "severity": class_info["severity"],
-                    "type": class_info["type"],
-                    "probabilities": prob_dict,
-                    "recommendation": recommendation,
-                    "next_steps": next_steps
-                }
-            except Exception as e:
-                return {
-                    "success": False,
-                    "error": f"Inference error: {str(e)}",
-                    "prediction": "Error",
-                    "confidence": 0.0
-                }
+def _run_skin_batch(batch):
+    session = registry.get("skin")
+    with model_input(session, batch, "skin") as inputs:
+        return session.run(None, {'input': inputs})
+
+SKIN_BATCHER = MicroBatcher("skin", _run_skin_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, BATCHING_ENABLED)
+
+SKIN_MODEL_MISSING = {
+    "success": False,
+    "error": "Model not found. Please convert .pth to .onnx format.",
+    "prediction": "Unknown",
+    "confidence": 0.0
+}
+
+def _preprocess_skin(image: Image.Image):
+    """Resize into (1, 224, 224, 3) uint8 pixels (normalized by model_input). Returns (pixels, error)"""
+    start = perf_counter_ns()
+    # Preprocessing (same as training)
+    img = image.convert("RGB").resize((224, 224))
+    pixels = np.asarray(img)[None]
+    metrics.observe("skin", "preprocess", start)
+    return pixels, None
+
+def _softmax(logits):
+    """Softmax over the last axis (one row of logits or a batch of them)"""
+    exp_logits = np.exp(logits - np.max(logits, axis=-1, keepdims=True))
+    return exp_logits / np.sum(exp_logits, axis=-1, keepdims=True)
+
+def _build_skin_result(logits, image=None, probs=None):
+    """Build the response from one row of logits, or from `probs` already averaged over TTA views"""
+    start = perf_counter_ns()
+    if probs is None:
+        probs = _softmax(logits)
+    
+    pred_class = int(np.argmax(probs))
+    confidence = float(probs[pred_class])
+    prediction = SKIN_CLASSES[pred_class]
+    
+    # Get class info
+    class_info = SKIN_CLASS_INFO[prediction]
+    
+    # Build probabilities dict
+    prob_dict = {SKIN_CLASSES[i]: float(probs[i]) for i in range(len(SKIN_CLASSES))}
+    
+    # Recommendations
+    if class_info["type"] == "Malignant":
+        recommendation = "URGENT: Consult a dermatologist immediately for biopsy"
+        next_steps = [
+            "Schedule dermatologist appointment ASAP",
+            "Get professional biopsy examination",
+            "Do not delay treatment"
+        ]
+    elif class_info["type"] == "Pre-cancerous":
+        recommendation = "CAUTION: Medical evaluation recommended"
+        next_steps = [
+            "Consult dermatologist within 1-2 weeks",
+            "Monitor for changes",
+            "Consider preventive treatment"
+        ]
+    else:
+        recommendation = "Likely benign, but monitor for changes"
+        next_steps = [
+            "Regular self-examination",
+            "Annual dermatology checkup",
+            "Watch for size/color changes"
+        ]
+    
+    metrics.observe("skin", "postprocess", start)
+    return {
+        "success": True,
+        "prediction": prediction,
+        "confidence": confidence,
+        "severity": class_info["severity"],
+        "type": class_info["type"],
+        "probabilities": prob_dict,
+        "recommendation": recommendation,
+        "next_steps": next_steps
+    }
+
+def _inference_error(e):
+    return {
+        "success": False,
+        "error": f"Inference error: {str(e)}",
+        "prediction": "Error",
+        "confidence": 0.0
+    }
+
+# ============= TEST-TIME AUGMENTATION =============
+# Views drawn from each model's training augmentations: flips, plus small
+# rotations inside RandomRotation's range (20 degrees skin, 15 lung)
+TTA_VIEWS = {
+    "skin": ["original", "hflip", "vflip", "rot180", "rot+15", "rot-15"],
+    "lung": ["original", "hflip", "rot+10", "rot-10"],
+}
+
+def _rotation_map(degrees, size=224):
+    """
+    Nearest-neighbour rotation about the image centre (torchvision's
+    RandomRotation default) as flat source-pixel indices, plus the mask of
+    output pixels whose source lies inside the image.
+    """
+    theta = np.deg2rad(degrees)
+    centre = (size - 1) / 2.0
+    y, x = np.mgrid[0:size, 0:size].astype(np.float64) - centre
+    src_x = np.rint(np.cos(theta) * x - np.sin(theta) * y + centre).astype(np.intp)
+    src_y = np.rint(np.sin(theta) * x + np.cos(theta) * y + centre).astype(np.intp)
+    inside = (src_x >= 0) & (src_x < size) & (src_y >= 0) & (src_y < size)
+    return np.where(inside, src_y * size + src_x, 0).ravel(), inside.ravel()
+
+_ROTATIONS = {view: _rotation_map(float(view[3:])) for views in TTA_VIEWS.values() for view in views
+              if view.startswith("rot") and view != "rot180"}
+
+def _tta_batch(pixels, views):
+    """Every view of (1, H, W, 3) input pixels as one (len(views), H, W, 3) batch"""
+    image = pixels[0]
+    batch = np.empty((len(views),) + image.shape, dtype=image.dtype)
+    for i, view in enumerate(views):
+        if view == "original":
+            batch[i] = image
+        elif view == "hflip":
+            batch[i] = image[:, ::-1]
+        elif view == "vflip":
+            batch[i] = image[::-1, :]
+        elif view == "rot180":
+            batch[i] = image[::-1, ::-1]
         else:
-            return {
-                "success": False,
-                "error": "Model not found. Please convert .pth to .onnx format.",
-                "prediction": "Unknown",
-                "confidence": 0.0
-            }
+            # Rotated-in corners are black, as in training
+            index, inside = _ROTATIONS[view]
+            flat = image.reshape(-1, image.shape[-1])
+            batch[i] = np.where(inside[:, None], flat[index], 0).reshape(image.shape)
+    return batch
+
+def _tta_summary(logits, views, class_names):
+    """Mean probabilities over the views, and how many views agree with the averaged call"""
+    view_probs = _softmax(logits)
+    probs = view_probs.mean(axis=0)
+    view_classes = np.argmax(view_probs, axis=1)
+    return probs, {
+        "views": views,
+        "agreement": round(float(np.mean(view_classes == np.argmax(probs))), 4),
+        "view_predictions": [class_names[c] for c in view_classes],
+    }
+
+async def process_skin_image(image: Image.Image, tta=False):
+    """Preprocess and predict skin cancer; with `tta`, average over augmented views run as one batch"""
+    if not await registry.aget("skin"):
+        return SKIN_MODEL_MISSING
+    
+    pixels, _ = await timed_threadpool("skin", _preprocess_skin, image)
+    
+    try:
+        if not tta:
+            # ONNX inference (batched with concurrent requests)
+            outputs = await SKIN_BATCHER.submit(pixels)
+            return _build_skin_result(outputs[0][0])
+        
+        views = TTA_VIEWS["skin"]
+        start = perf_counter_ns()
+        batch = _tta_batch(pixels, views)
+        metrics.observe("skin", "tta_views", start)
+        outputs = await SKIN_BATCHER.submit(batch)
+        probs, summary = _tta_summary(outputs[0], views, SKIN_CLASSES)
+        return {**_build_skin_result(None, probs=probs), "tta": summary}
+    except Exception as e:
+        return _inference_error(e)
+
+# Pneumonia model (loaded by the registry at startup or on first use)
+MODEL_PATH = MODELS_PATH / LUNG_MODEL_FILE
+registry.register("lung", MODEL_PATH, _session_loader("lung"))
+
+# Extra outputs of a pneumonia export that supports Grad-CAM (see STEP 10 of
+# machine_learning/notebooks/pneumonia_training.py)
+CAM_OUTPUTS = ["features", "cam_weights"]
+
+def lung_supports_cam(session):
+    output_names = {o.name for o in session.get_outputs()}
+    return all(name in output_names for name in CAM_OUTPUTS)
+
+HEATMAP_FORMATS = {"png": "image/png", "webp": "image/webp"}
+
+def compute_gradcam(features, cam_weights, class_idx):
+    """
+    Grad-CAM on blocks[-1] from the exported activations: ReLU of the
+    weighted channel sum, min-max scaled to [0, 1] (same post-processing as
+    pytorch_grad_cam). Stays at feature-map resolution until rendered.
+    """
+    cam = np.tensordot(cam_weights[class_idx], features, axes=(0, 0))
+    cam = np.maximum(cam, 0)
+    cam = cam - cam.min()
+    return (cam / (cam.max() + 1e-7)).astype(np.float32)
+
+def render_heatmap(image_array, cam, fmt="png"):
+    """Overlay a [0, 1] Grad-CAM map on the 224x224 RGB image and encode it as PNG or WebP bytes"""
+    import cv2  # only heatmaps need OpenCV, so it is imported on first use
     
-    return await run_in_threadpool(_inference)
-
-# Load pneumonia model
-MODEL_PATH = Path("app/models/pneumonia_model.onnx")
-PNEUMONIA_SESSION = None
-
-try:
-    if MODEL_PATH.exists():
-        PNEUMONIA_SESSION = ort.InferenceSession(str(MODEL_PATH))
-except Exception as e:
-    print(f"Warning: Could not load pneumonia model: {e}")
-    PNEUMONIA_SESSION = None
-
-def generate_gradcam(image_array, prediction):
-    """Generate Grad-CAM heatmap"""
-    heatmap = np.random.rand(224, 224) * prediction
-    heatmap = (heatmap * 255).astype(np.uint8)
+    start = perf_counter_ns()
+    cam = cv2.resize(cam, (224, 224), interpolation=cv2.INTER_LINEAR)
+    heatmap = (cam * 255).astype(np.uint8)
     heatmap = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
     
     original = cv2.resize(np.array(image_array), (224, 224))
     if len(original.shape) == 2:
         original = cv2.cvtColor(original, cv2.COLOR_GRAY2BGR)
+    else:
+        original = cv2.cvtColor(original, cv2.COLOR_RGB2BGR)
     
     overlay = cv2.addWeighted(original, 0.6, heatmap, 0.4, 0)
     
-    _, buffer = cv2.imencode('.png', overlay)
-    heatmap_base64 = base64.b64encode(buffer).decode('utf-8')
-    
-    return f"data:image/png;base64,{heatmap_base64}"
-
-async def process_lung_image(image: Image.Image):
-    """Preprocess and predict pneumonia with Grad-CAM"""
-    def _inference():
-        # Validate if image looks like X-ray (grayscale or low color variance)
-        img_rgb = image.convert('RGB')
-        img_array_check = np.array(img_rgb)
-        
-        # Check if image is mostly grayscale (X-rays are grayscale)
-        r, g, b = img_array_check[:,:,0], img_array_check[:,:,1], img_array_check[:,:,2]
-        
-        # Calculate color difference - X-rays have very similar RGB values
+    _, buffer = cv2.imencode(f'.{fmt}', overlay)
+    metrics.observe("lung", "heatmap_encode", start)
+    return buffer.tobytes()
+
+def _run_lung_batch(batch):
+    session = registry.get("lung")
+    output_names = [session.get_outputs()[0].name]
+    if lung_supports_cam(session):
+        output_names += CAM_OUTPUTS
+    with model_input(session, batch, "lung") as inputs:
+        return session.run(output_names, {'input': inputs})
+
+PNEUMONIA_BATCHER = MicroBatcher("lung", _run_lung_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, BATCHING_ENABLED)
+
+# Class order: 0 = Normal, 1 = Pneumonia
+LUNG_CLASSES = ["Normal", "Pneumonia"]
+
+LUNG_MODEL_MISSING = {
+    "success": False,
+    "error": "Model not found. Please train the model first.",
+    "prediction": "Unknown",
+    "confidence": 0.0
+}
+
+# The X-ray gate only needs image statistics, so it samples a small
+# nearest-neighbour thumbnail instead of scanning the decoded image
+XRAY_CHECK_SIZE = 64
+
+def _check_xray(image: Image.Image):
+    """Reject images that do not look like a chest X-ray. Returns an error result or None"""
+    thumb = image.resize((XRAY_CHECK_SIZE, XRAY_CHECK_SIZE), Image.NEAREST)
+    if image.mode == "L":
+        # Single-channel sources have no colour to check
+        pixels = np.asarray(thumb, dtype=np.int16)
+    else:
+        # Check if image is mostly grayscale (X-rays have very similar RGB
+        # values); int16 so the channel differences cannot wrap around
+        pixels = np.asarray(thumb.convert('RGB'), dtype=np.int16)
+        r, g, b = pixels[:,:,0], pixels[:,:,1], pixels[:,:,2]
         color_diff = np.mean(np.abs(r - g)) + np.mean(np.abs(g - b)) + np.mean(np.abs(r - b))
-        
-        # If color difference is high, it's not an X-ray
         if color_diff > 15:
             return {
                 "success": False,
@@ -177,100 +331,268 @@ async def process_lung_image(image: Image.Image):
                 "prediction": "Invalid Input",
                 "confidence": 0.0
             }
+    
+    # Check brightness - X-rays have specific brightness range
+    avg_brightness = np.mean(pixels)
+    if avg_brightness < 30 or avg_brightness > 230:
+        return {
+            "success": False,
+            "error": "Invalid Image: Image too dark or too bright. Please upload a proper chest X-ray.",
+            "prediction": "Invalid Input",
+            "confidence": 0.0
+        }
+    return None
+
+def _prepare_lung(image: Image.Image):
+    """
+    Validate the X-ray on a thumbnail, then resize once into (1, 224, 224, 3)
+    uint8 pixels. Returns (pixels, resized 224x224 array, error); the
+    resized array is kept for the Grad-CAM overlay.
+    """
+    start = perf_counter_ns()
+    error = _check_xray(image)
+    metrics.observe("lung", "validate", start)
+    if error:
+        return None, None, error
+    
+    start = perf_counter_ns()
+    if image.mode == "L":
+        # Grayscale fast path: resize the one channel, then repeat it into
+        # the three input channels
+        resized = np.asarray(image.resize((224, 224)))
+        pixels = np.repeat(resized[None, :, :, None], 3, axis=3)
+    else:
+        resized = np.asarray(image.convert('RGB').resize((224, 224)))
+        pixels = resized[None]
+    metrics.observe("lung", "preprocess", start)
+    return pixels, resized, None
+
+def _preprocess_lung(image: Image.Image):
+    """Validate the X-ray and resize it into (1, 224, 224, 3) uint8 pixels. Returns (pixels, error)"""
+    pixels, _, error = _prepare_lung(image)
+    return pixels, error
+
+def _build_lung_result(logits, image=None, features=None, cam_weights=None, probs=None):
+    """
+    Build the response from one row of logits, or from `probs` already
+    averaged over TTA views. When `image` (the resized 224x224 array from
+    _prepare_lung) is given and the model exported its
+    Grad-CAM outputs, a heatmap artifact is stored for lazy rendering and
+    only its ID and URL are returned.
+    """
+    start = perf_counter_ns()
+    if probs is None:
+        probs = _softmax(logits)
+    
+    pred_class = int(np.argmax(probs))
+    confidence = float(probs[pred_class])
+    
+    prediction = LUNG_CLASSES[pred_class]
+    
+    # Generate detailed analysis based on prediction
+    if pred_class == 1:  # Pneumonia
+        detailed_analysis = {
+            "findings": [
+                "Lungs: Opacities visible in lung fields",
+                "Infection signs: Indicates possible pneumonia",
+                "Consolidation: Fluid accumulation detected"
+            ],
+            "severity": "Moderate",
+            "next_steps": [
+                "Consult a doctor immediately",
+                "Get proper medical evaluation",
+                "Treatment may be required"
+            ]
+        }
+    else:  # Normal
+        detailed_analysis = {
+            "findings": [
+                "Lungs: Both lung fields appear clear",
+                "No infection: No signs of abnormality detected",
+                "Clear lung fields: Normal pattern observed"
+            ],
+            "severity": "Normal",
+            "next_steps": [
+                "No immediate action required",
+                "Maintain regular health checkups",
+                "Continue healthy lifestyle"
+            ]
+        }
+    
+    result = {
+        "success": True,
+        "prediction": prediction,
+        "confidence": confidence,
+        "probabilities": {
+            "Normal": float(probs[0]),
+            "Pneumonia": float(probs[1])
+        },
+        "recommendation": "Consult a doctor immediately" if pred_class == 1 else "No abnormalities detected",
+        "detailed_analysis": detailed_analysis
+    }
+    metrics.observe("lung", "postprocess", start)
+    
+    # Keep the Grad-CAM inputs; the overlay is encoded on GET /api/lung/heatmap/{id}
+    if image is not None and features is not None:
+        start = perf_counter_ns()
+        cam = compute_gradcam(features, cam_weights, pred_class)
+        heatmap_id = heatmap_store.put(image, cam)
+        result["heatmap_id"] = heatmap_id
+        result["heatmap_url"] = f"/api/lung/heatmap/{heatmap_id}"
+        metrics.observe("lung", "gradcam", start)
+    
+    return result
+
+async def process_lung_image(image: Image.Image, heatmap=False, tta=False):
+    """
+    Preprocess and predict pneumonia, with an opt-in Grad-CAM heatmap artifact.
+    With `tta`, average over augmented views run as one batch (the heatmap
+    is drawn from the original view).
+    """
+    if not await registry.aget("lung"):
+        return LUNG_MODEL_MISSING
+    
+    pixels, resized, error = await timed_threadpool("lung", _prepare_lung, image)
+    if error:
+        return error
+    
+    try:
+        probs = summary = None
+        if tta:
+            views = TTA_VIEWS["lung"]
+            start = perf_counter_ns()
+            pixels = _tta_batch(pixels, views)
+            metrics.observe("lung", "tta_views", start)
         
-        # Check brightness - X-rays have specific brightness range
-        avg_brightness = np.mean(img_array_check)
-        if avg_brightness < 30 or avg_brightness > 230:
-            return {
-                "success": False,
-                "error": "Invalid Image: Image too dark or too bright. Please upload a proper chest X-ray.",
-                "prediction": "Invalid Input",
-                "confidence": 0.0
-            }
-        
-        # Preprocess
-        img = image.convert('RGB').resize((224, 224))
-        img_array = np.array(img, dtype=np.float32)
-        img_array = img_array / 255.0
-        img_array = (img_array - np.array([0.485, 0.456, 0.406], dtype=np.float32)) / np.array([0.229, 0.224, 0.225], dtype=np.float32)
-        img_array = np.transpose(img_array, (2, 0, 1))
-        img_array = np.expand_dims(img_array, axis=0).astype(np.float32)
+        # ONNX inference (batched with concurrent requests)
+        outputs = await PNEUMONIA_BATCHER.submit(pixels)
+        if tta:
+            probs, summary = _tta_summary(outputs[0], views, LUNG_CLASSES)
         
-        if PNEUMONIA_SESSION:
-            try:
-                outputs = PNEUMONIA_SESSION.run(None, {'input': img_array})
-                logits = outputs[0][0]
-                
-                # Apply softmax properly
-                exp_logits = np.exp(logits - np.max(logits))  # Subtract max for numerical stability
-                probs = exp_logits / np.sum(exp_logits)
-                
-                pred_class = int(np.argmax(probs))
-                confidence = float(probs[pred_class])
-                
-                # Class order: 0 = Normal, 1 = Pneumonia
-                class_names = ["Normal", "Pneumonia"]
-                prediction = class_names[pred_class]
-                
-                # Generate detailed analysis based on prediction
-                if pred_class == 1:  # Pneumonia
-                    detailed_analysis = {
-                        "findings": [
-                            "Lungs: Opacities visible in lung fields",
-                            "Infection signs: Indicates possible pneumonia",
-                            "Consolidation: Fluid accumulation detected"
-                        ],
-                        "severity": "Moderate",
-                        "next_steps": [
-                            "Consult a doctor immediately",
-                            "Get proper medical evaluation",
-                            "Treatment may be required"
-                        ]
-                    }
-                else:  # Normal
-                    detailed_analysis = {
-                        "findings": [
-                            "Lungs: Both lung fields appear clear",
-                            "No infection: No signs of abnormality detected",
-                            "Clear lung fields: Normal pattern observed"
-                        ],
-                        "severity": "Normal",
-                        "next_steps": [
-                            "No immediate action required",
-                            "Maintain regular health checkups",
-                            "Continue healthy lifestyle"
-                        ]
-                    }
-                
-                # Generate heatmap with original image
-                original_img = np.array(image.convert('RGB').resize((224, 224)))
-                heatmap = generate_gradcam(original_img, probs[pred_class])
-                
-                return {
-                    "success": True,
-                    "prediction": prediction,
-                    "confidence": confidence,
-                    "probabilities": {
-                        "Normal": float(probs[0]),
-                        "Pneumonia": float(probs[1])
-                    },
-                    "heatmap": heatmap,
-                    "recommendation": "Consult a doctor immediately" if pred_class == 1 else "No abnormalities detected",
-                    "detailed_analysis": detailed_analysis
-                }
-            except Exception as e:
-                return {
-                    "success": False,
-                    "error": f"Inference error: {str(e)}",
-                    "prediction": "Error",
-                    "confidence": 0.0
-                }
+        if heatmap and len(outputs) == 3:
+            result = await timed_threadpool("lung", _build_lung_result, outputs[0][0], resized, outputs[1][0],
+                                            outputs[2][0], probs)
         else:
-            return {
-                "success": False,
-                "error": "Model not found. Please train the model first.",
-                "prediction": "Unknown",
-                "confidence": 0.0
-            }
+            result = _build_lung_result(outputs[0][0], probs=probs)
+        return {**result, "tta": summary} if tta else result
+    except Exception as e:
+        return _inference_error(e)
+
+# ============= CACHED UPLOAD PREDICTION =============
+async def _predict_upload(model_name, source, process, variant=None):
+    """
+    Content-addressed cache in front of process_*_image: uploads are keyed by
+    the SHA-256 of their bytes plus the model file version, and a hit skips
+    decoding, inference and heatmap rendering entirely.
+    """
+    key = None
+    if prediction_cache.enabled:
+        digest = await timed_threadpool(model_name, upload_digest, source)
+        key = (model_name, registry.version(model_name), digest, variant)
+        cached = prediction_cache.get(key)
+        # A cached result is only reusable while its heatmap artifact still exists
+        if cached is not None and ("heatmap_id" not in cached or heatmap_store.contains(cached["heatmap_id"])):
+            metrics.count_result(model_name, cached)
+            return {**cached, "cached": True}
+    
+    image, decode_ms = await timed_threadpool(model_name, decode_image, source)
+    metrics.observe_seconds(model_name, "decode", decode_ms / 1000.0)
+    result = await process(image)
+    metrics.count_result(model_name, result)
+    
+    # Only deterministic outcomes are cached, not missing-model or runtime errors
+    if key is not None and (result["success"] or result["prediction"] == "Invalid Input"):
+        prediction_cache.put(key, result)
+    return {**result, "cached": False, "timings": {"decode_ms": round(decode_ms, 3)}}
+
+async def process_skin_upload(source, tta=False):
+    """Decode (or serve from cache) and predict an uploaded skin image"""
+    async def _process(image):
+        return await process_skin_image(image, tta=tta)
+    return await _predict_upload("skin", source, _process, variant="tta" if tta else None)
+
+async def process_lung_upload(source, heatmap=False, tta=False):
+    """Decode (or serve from cache) and predict an uploaded chest X-ray"""
+    async def _process(image):
+        return await process_lung_image(image, heatmap=heatmap, tta=tta)
+    variant = "+".join(name for name, enabled in (("heatmap", heatmap), ("tta", tta)) if enabled) or None
+    return await _predict_upload("lung", source, _process, variant=variant)
+
+# ============= BULK PREDICTION =============
+# Decoding + preprocessing for bulk uploads runs in its own worker pool so a
+# large batch does not occupy every threadpool slot used by single requests
+_DECODE_POOL = ThreadPoolExecutor(max_workers=BULK_DECODE_WORKERS, thread_name_prefix="edds-decode")
+
+def _decode_and_preprocess(source, preprocess, model_name):
+    if isinstance(source, UploadRejected):
+        return None, {
+            "success": False,
+            "error": str(source),
+            "prediction": "Invalid Input",
+            "confidence": 0.0
+        }
+    try:
+        image, decode_ms = decode_image(source)
+        metrics.observe_seconds(model_name, "decode", decode_ms / 1000.0)
+    except Exception as e:
+        return None, {
+            "success": False,
+            "error": str(e),
+            "prediction": "Invalid Input",
+            "confidence": 0.0
+        }
+    try:
+        return preprocess(image)
+    except Exception as e:
+        return None, {
+            "success": False,
+            "error": f"Preprocessing error: {str(e)}",
+            "prediction": "Invalid Input",
+            "confidence": 0.0
+        }
+
+async def _process_images_bulk(items, preprocess, batcher, build_result):
+    """
+    Decode many (filename, source) items in parallel, run the valid ones as
+    large stacked batches and return one result per item in input order.
+    A bad item only fails its own entry.
+    """
+    loop = asyncio.get_running_loop()
+    prepared = await asyncio.gather(*[
+        loop.run_in_executor(_DECODE_POOL, _decode_and_preprocess, source, preprocess, batcher.name)
+        for _, source in items
+    ])
+    
+    results = [error for _, error in prepared]
+    valid = [i for i, (pixels, _) in enumerate(prepared) if pixels is not None]
     
-    return await run_in_threadpool(_inference)
+    async def _run_chunk(indices):
+        batch = np.concatenate([prepared[i][0] for i in indices], axis=0)
+        try:
+            outputs = await batcher.submit(batch)
+            logits = outputs[0]
+            for row, i in enumerate(indices):
+                results[i] = build_result(logits[row])
+        except Exception as e:
+            for i in indices:
+                results[i] = _inference_error(e)
+    
+    chunks = [valid[i:i + BULK_BATCH_SIZE] for i in range(0, len(valid), BULK_BATCH_SIZE)]
+    await asyncio.gather(*[_run_chunk(chunk) for chunk in chunks])
+    
+    for result in results:
+        metrics.count_result(batcher.name, result)
+    
+    return [{"filename": name, **result} for (name, _), result in zip(items, results)]
+
+async def process_skin_images(items):
+    """Bulk skin cancer prediction for a list of (filename, source)"""
+    if not await registry.aget("skin"):
+        return [{"filename": name, **SKIN_MODEL_MISSING} for name, _ in items]
+    return await _process_images_bulk(items, _preprocess_skin, SKIN_BATCHER, _build_skin_result)
+
+async def process_lung_images(items):
+    """Bulk pneumonia prediction for a list of (filename, source). Heatmaps are not rendered"""
+    if not await registry.aget("lung"):
+        return [{"filename": name, **LUNG_MODEL_MISSING} for name, _ in items]
+    return await _process_images_bulk(items, _preprocess_lung, PNEUMONIA_BATCHER, _build_lung_result)
@@ -0,0 +1,394 @@
+import asyncio
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import numpy as np
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.config import (
+    JOBS_DB, JOB_WORKERS, JOB_POLL_SECONDS, JOB_LEASE_SECONDS, JOB_TTL_SECONDS,
+    BULK_BATCH_SIZE, HEART_STREAM_CHUNK_ROWS
+)
+from app.schemas.models import HEART_FEATURES
+from app.services.heart_stream import RecordChunks, row_result
+from app.services.image_service import process_skin_images, process_lung_images
+from app.services.metrics import timed_threadpool
+from app.services.model_registry import registry
+from app.services.tabular_service import score_heart_chunk, MODEL_NOT_LOADED
+from app.services.upload_service import UploadRejected
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    name TEXT,
+    payload BLOB,
+    result TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class JobStore:
+    """
+    SQLite persistence for jobs and their items.
+
+    Every item keeps its input payload until a result is written for it,
+    then only the result. A restarted server therefore resumes a job from
+    its first unscored item. Jobs are claimed with a lease that the running
+    worker renews after every chunk and while a chunk is scored. Several
+    worker processes can share one file, and a job whose lease lapses (its
+    process died) is queued again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        """One connection per thread, in autocommit mode with explicit write transactions"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def create(self, model, items, chunk_size=1000):
+        """
+        Store a job from (name, payload, result) items, where `result` is set
+        for items rejected up front; returns (job_id, total). Items may be a
+        generator: they are written `chunk_size` at a time, each chunk in its
+        own short transaction, while the job stays 'creating' and unclaimable.
+        If the items raise, the partial job is deleted and the error re-raised.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        db = self._connect()
+        db.execute("INSERT INTO jobs (id, model, status, total, created_at) VALUES (?, ?, 'creating', 0, ?)",
+                   (job_id, model, now))
+        items = iter(items)
+        total = done = 0
+        try:
+            while True:
+                chunk = list(itertools.islice(items, chunk_size))
+                if not chunk:
+                    break
+                rows = [(job_id, total + idx, name, payload, None if result is None else json.dumps(result))
+                        for idx, (name, payload, result) in enumerate(chunk)]
+                self._write(db, "INSERT INTO job_items (job_id, idx, name, payload, result) VALUES (?, ?, ?, ?, ?)",
+                            rows)
+                total += len(rows)
+                done += sum(1 for row in rows if row[4] is not None)
+            finished = done == total
+            db.execute(
+                "UPDATE jobs SET status = ?, total = ?, done = ?, failed = ?, finished_at = ? WHERE id = ?",
+                ("completed" if finished else "queued", total, done, done, time.time() if finished else None, job_id))
+        except BaseException:
+            self._delete(db, [job_id])
+            raise
+        return job_id, total
+
+    @staticmethod
+    def _write(db, sql, rows):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(sql, rows)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _delete(db, job_ids):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany("DELETE FROM job_items WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+            db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def claim(self, lease_seconds):
+        """Mark the oldest queued job running and return (id, model), or None"""
+        db = self._connect()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs of a worker process that died are picked up again
+            db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat_at < ?",
+                       (now - lease_seconds,))
+            row = db.execute("SELECT id, model FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), heartbeat_at = ? "
+                           "WHERE id = ?", (now, now, row["id"]))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return (row["id"], row["model"]) if row is not None else None
+
+    def pending_items(self, job_id, limit):
+        """The next `limit` items without a result, as (idx, name, payload)"""
+        rows = self._connect().execute(
+            "SELECT idx, name, payload FROM job_items WHERE job_id = ? AND result IS NULL ORDER BY idx LIMIT ?",
+            (job_id, limit)).fetchall()
+        return [(row["idx"], row["name"], row["payload"]) for row in rows]
+
+    def save_results(self, job_id, results):
+        """
+        Write (idx, result) pairs, renew the lease and return the job's status
+        (e.g. "cancelled"). Items that already have a result are left alone and
+        not counted again, so a chunk scored twice (its job was reclaimed from
+        a worker that then finished anyway) cannot inflate `done`.
+        """
+        db = self._connect()
+        sql = "UPDATE job_items SET result = ?, payload = NULL WHERE job_id = ? AND idx = ? AND result IS NULL"
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            counts = []
+            for success in (True, False):
+                cursor = db.executemany(sql, [(json.dumps(result), job_id, idx) for idx, result in results
+                                              if result.get("success", False) == success])
+                counts.append(max(cursor.rowcount, 0))
+            db.execute("UPDATE jobs SET done = done + ?, failed = failed + ?, heartbeat_at = ? WHERE id = ?",
+                       (sum(counts), counts[1], time.time(), job_id))
+            row = db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return row["status"] if row is not None else None
+
+    def renew(self, job_id):
+        """Renew the lease on a running job while a long chunk is scored"""
+        self._connect().execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                                (time.time(), job_id))
+
+    def finish(self, job_id, status="completed", error=None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+            (status, error, time.time(), job_id))
+
+    def release(self, job_id):
+        """Hand a running job back to the queue (e.g. on shutdown) without waiting for its lease to lapse"""
+        self._connect().execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'running'", (job_id,))
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it had already finished"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id))
+        return cursor.rowcount > 0
+
+    def get(self, job_id, offset=0, limit=0):
+        """Job status plus up to `limit` results from item `offset`, or None if unknown"""
+        db = self._connect()
+        row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        del job["heartbeat_at"]
+        job["progress"] = round(job["done"] / job["total"], 4) if job["total"] else 1.0
+        if limit > 0:
+            results = db.execute(
+                "SELECT idx, result FROM job_items WHERE job_id = ? AND idx >= ? AND result IS NOT NULL "
+                "ORDER BY idx LIMIT ?", (job_id, offset, limit)).fetchall()
+            job["results"] = [{"index": r["idx"], **json.loads(r["result"])} for r in results]
+            if len(results) == limit:
+                job["next_offset"] = results[-1]["idx"] + 1
+        return job
+
+    def purge(self, ttl_seconds):
+        """Delete finished jobs older than `ttl_seconds`, and jobs left 'creating' by a process that died"""
+        db = self._connect()
+        cutoff = time.time() - ttl_seconds
+        expired = db.execute(
+            "SELECT id FROM jobs WHERE (status IN ('completed', 'failed', 'cancelled') AND finished_at < ?) "
+            "OR (status = 'creating' AND created_at < ?)", (cutoff, cutoff)).fetchall()
+        self._delete(db, [row["id"] for row in expired])
+
+
+# ============= JOB INPUTS =============
+def _rejected(name, error):
+    return {"filename": name, "success": False, "error": str(error), "prediction": "Invalid Input", "confidence": 0.0}
+
+def image_job_items(items):
+    """Yield (name, payload, result) items from iter_batch_uploads() output, one file read at a time"""
+    for name, source in items:
+        if isinstance(source, UploadRejected):
+            yield name, None, _rejected(name, source)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            yield name, bytes(source), None
+        else:
+            source.seek(0)
+            yield name, source.read(), None
+
+def heart_job_items(text, fmt, max_items):
+    """
+    Yield (name, payload, result) items, one per CSV/NDJSON record, reading
+    one RecordChunks chunk at a time. Raises ValueError for a bad CSV header
+    or an empty upload, and a 413 past `max_items` records.
+    """
+    total = 0
+    for values, errors in RecordChunks(text, fmt, HEART_STREAM_CHUNK_ROWS):
+        total += len(errors)
+        if total > max_items:
+            raise HTTPException(status_code=413, detail=f"Too many records (max {max_items} per job)")
+        for row, error in zip(values.tolist(), errors):
+            yield None, json.dumps({"values": row, "error": error}), None
+    if total == 0:
+        raise ValueError("No records found in upload")
+
+
+# ============= JOB RUNNERS =============
+# Each runner scores one chunk of pending (idx, name, payload) items through
+# the same bulk services as /predict_batch and returns results in order
+
+async def _run_images(process, items):
+    return await process([(name, payload) for _, name, payload in items])
+
+async def _run_heart(items):
+    records = [json.loads(payload) for _, _, payload in items]
+    values = np.array([record["values"] for record in records], dtype=np.float64).reshape(-1, len(HEART_FEATURES))
+    errors = [record["error"] for record in records]
+
+    model = await registry.aget("heart")
+    if model is None:
+        return [{"row": idx + 1, **MODEL_NOT_LOADED} for idx, _, _ in items]
+
+    rows = await timed_threadpool("heart", score_heart_chunk, model, values, errors)
+    return [row_result(idx + 1, row) for (idx, _, _), row in zip(items, rows)]
+
+async def _run_skin(items):
+    return await _run_images(process_skin_images, items)
+
+async def _run_lung(items):
+    return await _run_images(process_lung_images, items)
+
+# model -> (runner, items per chunk)
+RUNNERS = {
+    "skin": (_run_skin, BULK_BATCH_SIZE),
+    "lung": (_run_lung, BULK_BATCH_SIZE),
+    "heart": (_run_heart, HEART_STREAM_CHUNK_ROWS),
+}
+
+
+class JobQueue:
+    """
+    Bounded pool of background workers for long-running batch predictions.
+
+    Workers claim queued jobs from the JobStore and score their pending
+    items chunk by chunk, saving results after every chunk. A cancelled job
+    stops at its next chunk boundary and keeps the results it already has.
+    Workers are woken on submit and otherwise poll every `poll_seconds`,
+    which also picks up jobs submitted to other worker processes.
+    """
+
+    def __init__(self, path, workers=2, poll_seconds=2.0, lease_seconds=60.0, ttl_seconds=7 * 24 * 3600.0):
+        self.path = path
+        self.store = None
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.ttl_seconds = ttl_seconds
+        self._tasks = []
+        self._running = set()
+        self._wake = None
+
+    async def start(self):
+        """Open the store (here, not at import, so preloaded and forked workers each get their own) and start the workers"""
+        self.store = await run_in_threadpool(JobStore, self.path)
+        self._wake = asyncio.Event()
+        await run_in_threadpool(self.store.purge, self.ttl_seconds)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job_id in list(self._running):
+            await run_in_threadpool(self.store.release, job_id)
+        self._running.clear()
+
+    async def submit(self, model, items):
+        """Persist a new job, one runner chunk of items at a time, and wake a worker; returns (job_id, total)"""
+        job_id, total = await run_in_threadpool(self.store.create, model, items, RUNNERS[model][1])
+        if self._wake is not None:
+            self._wake.set()
+        return job_id, total
+
+    async def _worker(self):
+        while True:
+            claimed = await run_in_threadpool(self.store.claim, self.lease_seconds)
+            if claimed is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            await self._run(*claimed)
+
+    async def _run(self, job_id, model):
+        runner, chunk_size = RUNNERS[model]
+        self._running.add(job_id)
+        try:
+            while True:
+                items = await run_in_threadpool(self.store.pending_items, job_id, chunk_size)
+                if not items:
+                    await run_in_threadpool(self.store.finish, job_id)
+                    print(f"Job {job_id} ({model}) completed")
+                    break
+                heartbeat = asyncio.create_task(self._heartbeat(job_id))
+                try:
+                    results = await runner(items)
+                finally:
+                    heartbeat.cancel()
+                status = await run_in_threadpool(self.store.save_results, job_id, list(zip(
+                    [idx for idx, _, _ in items], results)))
+                if status != "running":
+                    print(f"Job {job_id} ({model}) stopped: {status}")
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"ERROR: Job {job_id} ({model}) failed: {e}")
+            await run_in_threadpool(self.store.finish, job_id, "failed", str(e))
+        self._running.discard(job_id)
+
+    async def _heartbeat(self, job_id):
+        """Renew the job's lease a few times per lease period, so a slow chunk is not reclaimed meanwhile"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await run_in_threadpool(self.store.renew, job_id)
+
+    def stats(self):
+        return {"workers": self.workers, "running": len(self._running)}
+
+
+job_queue = JobQueue(JOBS_DB, workers=JOB_WORKERS, poll_seconds=JOB_POLL_SECONDS,
+                     lease_seconds=JOB_LEASE_SECONDS, ttl_seconds=JOB_TTL_SECONDS)
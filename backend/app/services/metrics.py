@@ -0,0 +1,171 @@
+from collections import defaultdict
+from time import perf_counter_ns
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+# Histogram buckets are powers of two in nanoseconds, 2^14 ns (~16 us) to
+# 2^34 ns (~17 s), so the bucket of a value is found from its bit length
+# with one table lookup instead of a search
+_LOW_BIT, _HIGH_BIT = 14, 34
+BUCKETS = tuple(2 ** bit / 1e9 for bit in range(_LOW_BIT, _HIGH_BIT + 1))
+_SLOT = [min(max(bit - _LOW_BIT, 0), len(BUCKETS)) for bit in range(65)]
+
+PREDICT_MODELS = ("skin", "lung", "heart")
+
+
+def _new_histogram():
+    """[count per bucket..., count above the last bucket, sum in ns]"""
+    return [0] * (len(BUCKETS) + 2)
+
+
+def _observe_ns(histogram, value_ns):
+    histogram[_SLOT[(value_ns - 1).bit_length()]] += 1
+    histogram[-1] += value_ns
+
+
+class Metrics:
+    """
+    In-process metrics rendered in the Prometheus text format.
+
+    Per-stage timings are recorded as `start = perf_counter_ns()` ...
+    `metrics.observe(model, stage, start)`, which costs a clock read, a
+    dict lookup and two list increments (well under a microsecond).
+    Updates are not locked: a rare lost increment under thread contention
+    is accepted in exchange for keeping the hot path cheap.
+    """
+
+    def __init__(self):
+        self.stages = defaultdict(_new_histogram)           # (model, stage) -> histogram
+        self.threadpool_wait = defaultdict(_new_histogram)  # model -> histogram
+        self.requests = defaultdict(int)                    # (model, endpoint) -> count
+        self.errors = defaultdict(int)                      # model -> count
+        self.invalid_inputs = defaultdict(int)              # model -> count
+        self.rejected = defaultdict(int)                    # (model, route) -> requests shed by admission control
+        self.inflight = defaultdict(int)                    # (model, route) -> requests holding a slot (gauge)
+        self.queued = defaultdict(int)                      # (model, route) -> requests waiting for a slot (gauge)
+
+    def observe(self, model, stage, start_ns):
+        """Record the time elapsed since `start_ns` (a perf_counter_ns() reading)"""
+        elapsed = perf_counter_ns() - start_ns
+        histogram = self.stages[(model, stage)]
+        histogram[_SLOT[(elapsed - 1).bit_length()]] += 1
+        histogram[-1] += elapsed
+
+    def observe_seconds(self, model, stage, seconds):
+        _observe_ns(self.stages[(model, stage)], int(seconds * 1e9))
+
+    def count_result(self, model, result):
+        """Count a prediction result that is an error or an "Invalid Input" rejection"""
+        if not result.get("success", True):
+            if result.get("prediction") == "Invalid Input":
+                self.invalid_inputs[model] += 1
+            else:
+                self.errors[model] += 1
+
+    def render(self):
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, hist):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound:.9g}"}} {cumulative}')
+                cumulative += hist[-2]
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {hist[-1] / 1e9:.9f}")
+                lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+        def counter(name, help_text, series, kind="counter"):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{{{labels}}} {value}")
+
+        histogram("edds_stage_seconds", "Time spent in each pipeline stage",
+                  {f'model="{m}",stage="{s}"': h for (m, s), h in list(self.stages.items())})
+        histogram("edds_threadpool_wait_seconds", "Time work waited for a free threadpool worker",
+                  {f'model="{m}"': h for m, h in list(self.threadpool_wait.items())})
+        counter("edds_requests_total", "API requests by model and endpoint",
+                {f'model="{m}",endpoint="{e}"': v for (m, e), v in list(self.requests.items())})
+        counter("edds_errors_total", "Failed predictions and 5xx responses",
+                {f'model="{m}"': v for m, v in list(self.errors.items())})
+        counter("edds_invalid_inputs_total", "Images rejected as \"Invalid Input\"",
+                {f'model="{m}"': v for m, v in list(self.invalid_inputs.items())})
+        counter("edds_rejected_total", "Requests shed with 503 because the model's queue was full",
+                {f'model="{m}",route="{r}"': v for (m, r), v in list(self.rejected.items())})
+        counter("edds_inflight_requests", "Requests currently holding an admission slot",
+                {f'model="{m}",route="{r}"': v for (m, r), v in list(self.inflight.items())}, kind="gauge")
+        counter("edds_queued_requests", "Requests currently waiting for an admission slot",
+                {f'model="{m}",route="{r}"': v for (m, r), v in list(self.queued.items())}, kind="gauge")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+async def timed_threadpool(model, func, *args):
+    """fastapi's run_in_threadpool, also recording how long `func` queued for a worker"""
+    queued = perf_counter_ns()
+
+    def _call():
+        _observe_ns(metrics.threadpool_wait[model], perf_counter_ns() - queued)
+        return func(*args)
+
+    return await run_in_threadpool(_call)
+
+
+def json_response(model, content, **kwargs):
+    """JSONResponse with its serialization time recorded as the "serialize" stage"""
+    start = perf_counter_ns()
+    response = JSONResponse(content=content, **kwargs)
+    metrics.observe(model, "serialize", start)
+    return response
+
+
+class MetricsMiddleware:
+    """
+    Counts /api/<model>/... requests per route and 5xx responses, and times
+    how long the request body took to arrive ("upload_read" stage).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        parts = scope["path"].split("/") if scope["type"] == "http" else []
+        if len(parts) < 4 or parts[1] != "api" or parts[2] not in PREDICT_MODELS:
+            return await self.app(scope, receive, send)
+
+        model = parts[2]
+        read_ns = 0
+
+        async def timed_receive():
+            nonlocal read_ns
+            start = perf_counter_ns()
+            message = await receive()
+            if message["type"] == "http.request":
+                read_ns += perf_counter_ns() - start
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start" and message["status"] >= 500:
+                metrics.errors[model] += 1
+            await send(message)
+
+        try:
+            await self.app(scope, timed_receive, counting_send)
+        except Exception:
+            # Unhandled errors become a 500 further out, past counting_send
+            metrics.errors[model] += 1
+            raise
+        finally:
+            # Label by route template so unknown paths and path parameters
+            # (e.g. heatmap IDs) cannot grow the label set
+            route = scope.get("route")
+            if route is not None:
+                metrics.requests[(model, route.path.lstrip("/"))] += 1
+            if read_ns and scope["method"] in ("POST", "PUT"):
+                _observe_ns(metrics.stages[(model, "upload_read")], read_ns)
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+from fastapi.concurrency import run_in_threadpool
+from app.config import MODEL_LOADING, MODELS_DIR, MODEL_CHECK_INTERVAL
+
+MODELS_PATH = Path(MODELS_DIR).resolve()
+
+
+def _current_rss():
+    """Resident set size of this process in bytes (None if unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def process_memory():
+    """
+    This worker's memory in bytes. "pss" splits pages shared with other
+    processes (memory-mapped weights, copy-on-write pages from a pre-fork
+    master) evenly between them, so summing it across workers gives the
+    real total. Falls back to RSS only where smaps_rollup is unavailable.
+    """
+    fields = {"Rss:": "rss", "Pss:": "pss", "Shared_Clean:": "shared_clean", "Shared_Dirty:": "shared_dirty",
+              "Private_Clean:": "private_clean", "Private_Dirty:": "private_dirty"}
+    memory = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if parts and parts[0] in fields:
+                    memory[fields[parts[0]]] = int(parts[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        memory["rss"] = _current_rss()
+    return memory
+
+
+class ModelEntry:
+    def __init__(self, name, path, loader, fork_safe=False, eager=True):
+        self.name = name
+        self.path = Path(path)
+        self.loader = loader  # callable(Path) -> model object
+        self.fork_safe = fork_safe  # may be loaded in a pre-fork master and shared copy-on-write
+        self.eager = eager  # loaded by startup() in "eager" mode; otherwise always on first use
+        self.model = None
+        self.error = None
+        self.load_seconds = None
+        self.memory_bytes = None
+        self.attempted = False
+        self.loaded_version = None
+        self.file_version = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def current_version(self, check_interval):
+        """File version (mtime + size), re-read from disk at most every check_interval seconds"""
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at >= check_interval:
+            try:
+                st = self.path.stat()
+                self.file_version = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+            except OSError:
+                self.file_version = None
+            self.checked_at = now
+        return self.file_version
+
+    def status(self):
+        file_size = self.path.stat().st_size if self.path.exists() else None
+        return {
+            "loaded": self.model is not None,
+            "path": str(self.path),
+            "file_size_mb": round(file_size / (1024 * 1024), 2) if file_size is not None else None,
+            "load_seconds": round(self.load_seconds, 4) if self.load_seconds is not None else None,
+            "memory_mb": round(self.memory_bytes / (1024 * 1024), 2) if self.memory_bytes is not None else None,
+            "version": self.loaded_version,
+            "error": self.error,
+        }
+
+
+class ModelRegistry:
+    """
+    Single owner of every loaded model.
+
+    Services register a loader for each model at import time; the FastAPI
+    lifespan hook then loads them all concurrently ("eager") or leaves them
+    to be loaded on first use ("lazy"). Load time and the RSS growth seen
+    while loading are recorded per model. With concurrent eager loading the
+    memory figures overlap and should be read as approximate.
+
+    Each model's version is derived from its file's mtime and size. When the
+    file changes, the model is reloaded on next use and reload listeners
+    (e.g. the prediction cache) are notified.
+
+    Models registered with eager=False (e.g. ones only some requests need)
+    always load on first use.
+
+    Fork-safe models can be loaded once in a pre-fork server master with
+    preload(); forked workers then share those pages copy-on-write and
+    startup() finds them already loaded.
+    """
+
+    def __init__(self, mode="eager", check_interval=2.0):
+        self.mode = mode
+        self.check_interval = check_interval
+        self._entries = {}
+        self._reload_listeners = []
+
+    def register(self, name, path, loader, fork_safe=False, eager=True):
+        self._entries[name] = ModelEntry(name, path, loader, fork_safe, eager)
+
+    def names(self):
+        return list(self._entries)
+
+    def on_reload(self, callback):
+        """Register callback(name) to run whenever a changed model file is reloaded"""
+        self._reload_listeners.append(callback)
+
+    def version(self, name):
+        """Version of the model file on disk (None if missing)"""
+        return self._entries[name].current_version(self.check_interval)
+
+    def _is_current(self, entry):
+        return entry.attempted and entry.loaded_version == entry.current_version(self.check_interval)
+
+    def load(self, name):
+        """Load a model (once per file version) and return it, or None if loading failed"""
+        entry = self._entries[name]
+        if self._is_current(entry):
+            return entry.model
+        
+        with entry.lock:
+            if self._is_current(entry):
+                return entry.model
+            
+            reloading = entry.attempted
+            entry.loaded_version = entry.current_version(self.check_interval)
+            rss_before = _current_rss()
+            start = time.perf_counter()
+            try:
+                if not entry.path.exists():
+                    raise FileNotFoundError(f"{entry.path} not found")
+                entry.model = entry.loader(entry.path)
+                entry.error = None
+            except Exception as e:
+                entry.model = None
+                entry.error = str(e)
+            entry.load_seconds = time.perf_counter() - start
+            rss_after = _current_rss()
+            if entry.model is not None and rss_before is not None and rss_after is not None:
+                entry.memory_bytes = max(0, rss_after - rss_before)
+            entry.attempted = True
+        
+        if entry.model is not None:
+            print(f"{'Reloaded' if reloading else 'Loaded'} {name} model in {entry.load_seconds:.2f}s from {entry.path}")
+        else:
+            print(f"WARNING: Could not load {name} model: {entry.error}")
+        if reloading:
+            for callback in self._reload_listeners:
+                callback(name)
+        return entry.model
+
+    def get(self, name):
+        """Return the model, loading it on this thread if it is not loaded yet"""
+        return self.load(name)
+
+    async def aget(self, name):
+        """Like get(), but a lazy load runs in the threadpool instead of the event loop"""
+        entry = self._entries[name]
+        if self._is_current(entry):
+            return entry.model
+        return await run_in_threadpool(self.load, name)
+
+    def is_loaded(self, name):
+        entry = self._entries.get(name)
+        return entry is not None and entry.model is not None
+
+    def preload(self, names):
+        """Load fork-safe models in the current (master) process before workers are forked"""
+        for name in names:
+            entry = self._entries.get(name)
+            if entry is None:
+                print(f"WARNING: Cannot preload unknown model '{name}'")
+            elif not entry.fork_safe:
+                # ONNX Runtime thread pools do not survive fork()
+                print(f"{name} model is not fork-safe; it will load in each worker instead")
+            else:
+                self.load(name)
+
+    async def startup(self):
+        if self.mode == "lazy":
+            print(f"Model loading is lazy; models load on first use: {', '.join(self._entries)}")
+            return
+        await asyncio.gather(*[run_in_threadpool(self.load, name)
+                               for name, entry in self._entries.items() if entry.eager])
+
+    def unload_all(self):
+        for entry in self._entries.values():
+            with entry.lock:
+                entry.model = None
+                entry.attempted = False
+                entry.loaded_version = None
+                entry.memory_bytes = None
+
+    def status(self):
+        return {name: entry.status() for name, entry in self._entries.items()}
+
+
+registry = ModelRegistry(mode=MODEL_LOADING, check_interval=MODEL_CHECK_INTERVAL)
@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from app.config import CACHE_ENABLED, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_SECONDS
+from app.services.model_registry import registry
+
+
+class PredictionCache:
+    """
+    Bounded LRU + TTL cache for prediction results.
+
+    Keys are (model, model_version, content_key) tuples, so a new model file
+    never serves old results; entries for a reloaded model are also dropped
+    eagerly via invalidate_model(). Memory is bounded both by entry count and
+    by the approximate JSON size of the cached results.
+    """
+
+    def __init__(self, max_entries=4096, max_bytes=64 * 1024 * 1024, ttl_seconds=3600.0, enabled=True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.enabled = enabled
+
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        model = key[0]
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses[model] += 1
+                return None
+            expires_at, size, value = item
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses[model] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits[model] += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        size = len(json.dumps(value, separators=(",", ":")))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate_model(self, model):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == model]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        models = sorted(set(self.hits) | set(self.misses))
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "evictions": self.evictions,
+            "hits": {m: self.hits[m] for m in models},
+            "misses": {m: self.misses[m] for m in models},
+        }
+
+
+prediction_cache = PredictionCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    enabled=CACHE_ENABLED,
+)
+
+# A reloaded model file makes every cached result for that model stale
+registry.on_reload(prediction_cache.invalidate_model)
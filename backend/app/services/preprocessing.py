@@ -0,0 +1,79 @@
+import threading
+from contextlib import contextmanager
+import numpy as np
+from app.config import PREPROCESS_BUFFERS
+
+# ImageNet normalization used by both image models, shaped once for NCHW batches
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+_MEAN_NCHW = IMAGENET_MEAN.reshape(1, 3, 1, 1)
+_STD_NCHW = IMAGENET_STD.reshape(1, 3, 1, 1)
+
+
+class PreprocessEngine:
+    """
+    Normalizes (N, H, W, 3) uint8 pixel batches into (N, 3, H, W) float32
+    model input, written in place into preallocated buffers.
+
+    Each inference call borrows a buffer (one batch slot) for as long as the
+    model runs and gets a contiguous view of its first N rows, which ONNX
+    Runtime reads without copying. Calls that overlap never share a buffer.
+    A batch larger than every idle buffer gets a new one sized for it;
+    up to `max_buffers` idle buffers are kept, largest first.
+    """
+
+    def __init__(self, max_buffers=4):
+        self.max_buffers = max(0, max_buffers)
+        self.allocations = 0
+        self.reuses = 0
+        self._idle = []  # sorted by capacity, smallest first
+        self._lock = threading.Lock()
+
+    def _acquire(self, shape):
+        with self._lock:
+            for i, buffer in enumerate(self._idle):
+                if buffer.shape[1:] == shape[1:] and buffer.shape[0] >= shape[0]:
+                    self.reuses += 1
+                    return self._idle.pop(i)
+            self.allocations += 1
+        return np.empty(shape, dtype=np.float32)
+
+    def _release(self, buffer):
+        with self._lock:
+            self._idle.append(buffer)
+            self._idle.sort(key=len)
+            del self._idle[:max(0, len(self._idle) - self.max_buffers)]
+
+    @contextmanager
+    def normalized(self, pixels):
+        """
+        Yield the normalized batch: the same float32 operations, in the same
+        order, as (pixels / 255 - mean) / std, so results are bit-identical.
+        Only valid inside the with block; the buffer is reused afterwards.
+        """
+        n, height, width, channels = pixels.shape
+        buffer = self._acquire((n, channels, height, width))
+        try:
+            tensor = buffer[:n]
+            np.copyto(tensor, pixels.transpose(0, 3, 1, 2), casting="unsafe")
+            np.divide(tensor, np.float32(255.0), out=tensor)
+            np.subtract(tensor, _MEAN_NCHW, out=tensor)
+            np.divide(tensor, _STD_NCHW, out=tensor)
+            yield tensor
+        finally:
+            self._release(buffer)
+
+    def stats(self):
+        with self._lock:
+            idle_bytes = sum(buffer.nbytes for buffer in self._idle)
+            return {
+                "idle_buffers": len(self._idle),
+                "idle_mb": round(idle_bytes / (1024 * 1024), 2),
+                "max_buffers": self.max_buffers,
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+            }
+
+
+# Shared by the skin and lung models
+preprocess_engine = PreprocessEngine(max_buffers=PREPROCESS_BUFFERS)
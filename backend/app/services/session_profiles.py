@@ -0,0 +1,177 @@
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from app.config import SESSION_PROFILES_FILE
+
+# The two image models share the machine, so by default each gets half the
+# cores for intra-op work and ORT's worker threads do not spin while idle
+DEFAULT_PROFILE = {
+    "intra_op_threads": max(1, (os.cpu_count() or 2) // 2),
+    "inter_op_threads": 1,
+    "execution_mode": "sequential",
+    "graph_optimization": "all",
+    "optimized_model_path": None,
+    "enable_cpu_mem_arena": True,
+    "enable_mem_pattern": True,
+    "allow_spinning": False,
+    "shared_weights": False,
+}
+
+# Per-model defaults. The settings shared by all models (the file's "default"
+# section, EDDS_ORT_<FIELD>) do not override them; only the model's own
+# section or EDDS_<MODEL>_ORT_<FIELD> can. The heart tree ensemble is tiny,
+# and one thread keeps its tree sum in the same order as XGBoost (bit-exact
+# probabilities), so e.g. EDDS_ORT_INTRA_OP_THREADS=8 leaves heart at 1.
+MODEL_DEFAULTS = {
+    "heart": {"intra_op_threads": 1},
+}
+
+# Enum member names, looked up when a session is built: onnxruntime is only
+# imported once the first ONNX model loads, not when the app is imported
+EXECUTION_MODES = {
+    "sequential": "ORT_SEQUENTIAL",
+    "parallel": "ORT_PARALLEL",
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+def _parse(field, value):
+    default = DEFAULT_PROFILE[field]
+    if isinstance(default, bool):
+        return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if field == "optimized_model_path":
+        return str(value) if value else None
+    value = str(value).strip().lower()
+    choices = EXECUTION_MODES if field == "execution_mode" else GRAPH_OPTIMIZATION_LEVELS
+    if value not in choices:
+        raise ValueError(f"{field} must be one of: {', '.join(choices)}")
+    return value
+
+
+def load_session_profile(model_name, profiles_file=SESSION_PROFILES_FILE, environ=os.environ):
+    """
+    Resolve one model's session profile. Later sources win:
+    defaults < model defaults < file "default" < file "<model>" < EDDS_ORT_<FIELD> < EDDS_<MODEL>_ORT_<FIELD>
+    except that the shared sources (file "default", EDDS_ORT_<FIELD>) skip
+    the fields a model default pins.
+    """
+    pinned = MODEL_DEFAULTS.get(model_name, {})
+    profile = dict(DEFAULT_PROFILE)
+    profile.update(pinned)
+    
+    if profiles_file:
+        with open(profiles_file) as f:
+            sections = json.load(f)
+        for section in ("default", model_name):
+            for field, value in sections.get(section, {}).items():
+                if field not in DEFAULT_PROFILE:
+                    raise ValueError(f"Unknown session profile field '{field}' in {profiles_file}")
+                if section == "default" and field in pinned:
+                    continue
+                profile[field] = _parse(field, value)
+    
+    for prefix in ("EDDS_ORT_", f"EDDS_{model_name.upper()}_ORT_"):
+        for field in DEFAULT_PROFILE:
+            value = environ.get(prefix + field.upper())
+            if value not in (None, "") and not (prefix == "EDDS_ORT_" and field in pinned):
+                profile[field] = _parse(field, value)
+    
+    return profile
+
+
+def build_session_options(profile):
+    import onnxruntime as ort
+    
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = profile["intra_op_threads"]
+    options.inter_op_num_threads = profile["inter_op_threads"]
+    options.execution_mode = getattr(ort.ExecutionMode, EXECUTION_MODES[profile["execution_mode"]])
+    options.graph_optimization_level = getattr(ort.GraphOptimizationLevel,
+                                               GRAPH_OPTIMIZATION_LEVELS[profile["graph_optimization"]])
+    options.enable_cpu_mem_arena = profile["enable_cpu_mem_arena"]
+    options.enable_mem_pattern = profile["enable_mem_pattern"]
+    spinning = "1" if profile["allow_spinning"] else "0"
+    options.add_session_config_entry("session.intra_op.allow_spinning", spinning)
+    options.add_session_config_entry("session.inter_op.allow_spinning", spinning)
+    if profile["shared_weights"]:
+        # Pre-packing copies weights into private buffers; without it the
+        # kernels read them straight from the memory-mapped .data file
+        options.add_session_config_entry("session.disable_prepacking", "1")
+    return options
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Serialize writers of `path` across worker processes (no-op where flock is unavailable)"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path.with_name(path.name + ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_onnx_session(path: Path, profile):
+    """
+    Create an InferenceSession for `path` using `profile`.
+
+    With `optimized_model_path` set, the optimized graph is saved there on
+    first load; later loads reuse it (skipping graph optimization) as long
+    as it is newer than the source model.
+
+    With `shared_weights`, the optimized graph (default: <model>.shared.onnx)
+    is saved with its weights in an external .data file and the session is
+    always built from that file with no further optimization. ONNX Runtime
+    then maps the weights as a private copy-on-write mapping. It never
+    writes to them, so every worker process on the machine shares one copy
+    through the page cache.
+    """
+    import onnxruntime as ort
+    
+    options = build_session_options(profile)
+    model_path = Path(path)
+    shared = profile["shared_weights"]
+    
+    optimized = profile["optimized_model_path"]
+    if shared and not optimized:
+        optimized = model_path.with_name(model_path.stem + ".shared.onnx")
+    if not optimized:
+        return ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+    
+    optimized = Path(optimized)
+    with _file_lock(optimized):
+        if not (optimized.exists() and optimized.stat().st_mtime >= model_path.stat().st_mtime):
+            options.optimized_model_filepath = str(optimized)
+            if shared:
+                options.add_session_config_entry(
+                    "session.optimized_model_external_initializers_file_name", optimized.name + ".data")
+                options.add_session_config_entry(
+                    "session.optimized_model_external_initializers_min_size_in_bytes", "1024")
+            session = ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+            if not shared:
+                return session
+            # This session owns private copies of the weights; reopen from the
+            # saved file so this worker maps them like all the others
+            del session
+            options = build_session_options(profile)
+    
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    return ort.InferenceSession(str(optimized), sess_options=options, providers=["CPUExecutionProvider"])
+
+
+# Resolved once at startup; shown by /api/*/info
+SESSION_PROFILES = {name: load_session_profile(name) for name in ("skin", "lung", "heart")}
@@ -0,0 +1,49 @@
+import ctypes
+import ctypes.util
+import numpy as np
+
+# XGBoost's binary:logistic transform is 1 / (1 + expf(-x)) in float32 with
+# the C library's expf. Rounding a float64 exp() to float32 gives the same
+# value except next to a midpoint between two float32s: glibc's expf is
+# accurate to 0.502 ULP, not correctly rounded, so it may round such ties
+# the other way. Over every float32 input on glibc 2.36, all 170,648 that
+# differ lie within 0.0017 ULP of a midpoint. Only values within
+# EXPF_TIE_MARGIN of one (about 0.5%) go through the per-element ctypes
+# expf, so the Python-level loop stays off the hot path. Shared by the
+# server and heart_disease_training.py (ONNX export parity).
+EXPF_TIE_MARGIN = 0.01  # ULP
+
+
+def _libm_expf():
+    """The C library's float32 exp as a numpy ufunc, or None if it cannot be found"""
+    libm = ctypes.util.find_library("m")
+    if not libm:
+        return None
+    expf = ctypes.CDLL(libm).expf
+    expf.restype, expf.argtypes = ctypes.c_float, [ctypes.c_float]
+    return np.frompyfunc(expf, 1, 1)
+
+_EXPF = _libm_expf()
+
+
+def _expf(x):
+    """expf(x) for a float32 array: vectorized float64 exp, libm expf for near-ties"""
+    with np.errstate(invalid="ignore", over="ignore"):
+        exact = np.exp(x.astype(np.float64))
+        result = exact.astype(np.float32)
+        if _EXPF is None:
+            return result
+
+        # The float32 ULP on the side of the exact value
+        toward = np.where(exact > result, np.float32(np.inf), np.float32(-np.inf)).astype(np.float32)
+        ulp = np.abs(np.nextafter(result, toward).astype(np.float64) - result)
+        near_tie = np.abs(exact - result) > (0.5 - EXPF_TIE_MARGIN) * ulp
+    if near_tie.any():
+        result[near_tie] = _EXPF(x[near_tie]).astype(np.float32)
+    return result
+
+
+def xgboost_sigmoid(margin):
+    """XGBoost's float32 sigmoid, 1 / (1 + expf(-x)), matching predict_proba bit for bit"""
+    exp_neg = _expf(-np.asarray(margin, dtype=np.float32))
+    return (np.float32(1) / (exp_neg + np.float32(1))).astype(np.float32)
@@ -0,0 +1,78 @@
+import builtins
+import sys
+import threading
+from time import perf_counter
+from app.config import PROFILE_STARTUP
+
+
+class ImportProfiler:
+    """
+    Times first-time imports by wrapping builtins.__import__, like
+    `python -X importtime` but from inside a running server. Each module
+    records who imported it, its inclusive time and its self time (minus
+    the imports it triggered). Deferred imports (onnxruntime when the first
+    ONNX model loads) are recorded too, on whichever thread makes them.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records = {}  # module -> (importer, inclusive seconds, self seconds)
+        self._local = threading.local()
+        self._original = builtins.__import__
+
+    def install(self):
+        if not self.enabled:
+            self.enabled = True
+            builtins.__import__ = self._import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = perf_counter()
+        try:
+            module = self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+        importer = (globals or {}).get("__name__", "?")
+        self.records.setdefault(name, (importer, elapsed, elapsed - nested))
+        return module
+
+    def app_imports(self, min_ms=1.0):
+        """Imports made by app modules (and the app modules themselves), slowest first"""
+        rows = [(name, importer, total * 1000.0, own * 1000.0)
+                for name, (importer, total, own) in self.records.items()
+                if _is_app(name) or _is_app(importer)]
+        return sorted((row for row in rows if row[2] >= min_ms), key=lambda row: -row[2])
+
+
+def _is_app(module):
+    return module == "app" or module.startswith("app.")
+
+
+startup_profile = ImportProfiler()
+if PROFILE_STARTUP:
+    startup_profile.install()
+
+
+def print_startup_profile(models, load_seconds):
+    """Per-module import times and per-model load times (EDDS_PROFILE_STARTUP)"""
+    rows = startup_profile.app_imports()
+    main_ms = sum(total for name, importer, total, own in rows if importer == "app.main")
+    print(f"Startup profile: app.main imports took {main_ms:.1f} ms, model loading {load_seconds * 1000:.0f} ms")
+    print(f"  {'total ms':>9} {'self ms':>9}  module (imported by)")
+    for name, importer, total, own in rows:
+        print(f"  {total:9.1f} {own:9.1f}  {name} ({importer})")
+    print(f"  {'load s':>9} {'memory MB':>9}  model")
+    for name, status in models.items():
+        if status["load_seconds"] is None:
+            state = status["error"] or "not loaded yet"
+            print(f"  {'-':>9} {'-':>9}  {name} ({state})")
+        else:
+            memory = f"{status['memory_mb']:9.1f}" if status["memory_mb"] is not None else f"{'-':>9}"
+            print(f"  {status['load_seconds']:9.3f} {memory}  {name}")
@@ -1,43 +1,189 @@
 import numpy as np
-import joblib
-import os
-from fastapi.concurrency import run_in_threadpool
+from pathlib import Path
+from time import perf_counter_ns
+from app.config import HEART_USES_ONNX, HEART_STREAM_CHUNK_ROWS
+from app.schemas.models import HEART_FEATURES
+from app.services.model_registry import registry, MODELS_PATH
+from app.services.prediction_cache import prediction_cache
+from app.services.metrics import metrics, timed_threadpool
+from app.services.heart_stream import score_chunk, score_stream
+from app.services.session_profiles import load_onnx_session, SESSION_PROFILES
+from app.services.sigmoid import xgboost_sigmoid
 
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "../models/heart_disease_model.pkl")
-model = None
+class OnnxHeartModel:
+    """
+    The booster exported by heart_disease_training.py, run by ONNX Runtime.
+    The graph returns the raw margin; predict_proba() matches
+    XGBClassifier.predict_proba without importing xgboost or scikit-learn.
+    """
+    
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+    
+    def predict_proba(self, features):
+        margin = self.session.run(None, {self.input_name: features})[0][:, 0]
+        p1 = xgboost_sigmoid(margin)
+        return np.stack([np.float32(1) - p1, p1], axis=1)
+
+def _load_onnx(path: Path):
+    return OnnxHeartModel(load_onnx_session(path, SESSION_PROFILES["heart"]))
+
+def _load_pickle(path: Path):
+    import joblib
+    return joblib.load(path)
+
+# Heart disease model (loaded by the registry at startup or on first use)
+ONNX_MODEL_PATH = MODELS_PATH / "heart_disease_model.onnx"
+PICKLE_MODEL_PATH = MODELS_PATH / "heart_disease_model.pkl"
+if HEART_USES_ONNX:
+    HEART_MODEL_BACKEND, MODEL_PATH = "onnx", ONNX_MODEL_PATH
+    registry.register("heart", MODEL_PATH, _load_onnx)
+    # Explanations need the booster itself; load it only when first asked for
+    EXPLAINER_NAME = "heart_booster"
+    registry.register(EXPLAINER_NAME, PICKLE_MODEL_PATH, _load_pickle, fork_safe=True, eager=False)
+else:
+    # The unpickled booster holds no threads, so a pre-fork master can share it
+    HEART_MODEL_BACKEND, MODEL_PATH = "xgboost", PICKLE_MODEL_PATH
+    registry.register("heart", MODEL_PATH, _load_pickle, fork_safe=True)
+    EXPLAINER_NAME = "heart"
+
+MODEL_NOT_LOADED = {
+    "success": False,
+    "prediction": "Error",
+    "confidence": 0.0,
+    "details": {"message": "Model not loaded"}
+}
+
+def _feature_matrix(records):
+    """Build an (N, 13) matrix in the schema's fixed feature order"""
+    start = perf_counter_ns()
+    features = np.array([[record[name] for name in HEART_FEATURES] for record in records], dtype=np.float32)
+    metrics.observe("heart", "preprocess", start)
+    return features
+
+def _score(model, features):
+    """Single predict_proba pass; labels are derived from the probabilities"""
+    start = perf_counter_ns()
+    proba = model.predict_proba(features)
+    metrics.observe("heart", "inference", start)
+    labels = np.argmax(proba, axis=1)
+    return proba, labels
+
+def _explain(explainer, features, top_k):
+    """
+    Exact TreeSHAP contributions from the booster's native pred_contribs.
+    One call per batch yields an (N, 13 + 1) matrix (last column: the bias).
+    Only the attributions are used: probabilities and labels come from the
+    served model, so an explained score matches /predict bit for bit.
+    Returns (top feature indices, their contributions, bias).
+    """
+    import xgboost as xgb
+    
+    start = perf_counter_ns()
+    dmatrix = xgb.DMatrix(features, feature_names=HEART_FEATURES)
+    contribs = explainer.get_booster().predict(dmatrix, pred_contribs=True)
+    metrics.observe("heart", "explain", start)
+    
+    per_feature = contribs[:, :-1]
+    top = np.argsort(-np.abs(per_feature), axis=1, kind="stable")[:, :top_k]
+    return top, np.take_along_axis(per_feature, top, axis=1), contribs[:, -1]
+
+def _build_result(proba, label, explanation=None):
+    risk_score = float(proba[1])
+    details = {
+        "risk_percentage": round(risk_score * 100, 2),
+        "message": "Prediction from trained XGBoost model",
+    }
+    
+    if explanation is not None:
+        features, top, contributions, bias = explanation
+        details["base_value"] = float(bias)
+        details["shap_values"] = [
+            {"feature": HEART_FEATURES[i], "value": float(features[i]), "contribution": float(c)}
+            for i, c in zip(top, contributions)
+        ]
+        # Features pushing this patient's risk up, strongest first
+        details["top_risk_factors"] = [HEART_FEATURES[i] for i, c in zip(top, contributions) if c > 0]
+    
+    return {
+        "success": True,
+        "prediction": "Low Risk" if label == 0 else "High Risk",
+        "confidence": float(max(proba)),
+        "details": details
+    }
+
+def _build_results(model, records, top_k, explainer=None):
+    """Score (and with top_k, explain through `explainer`) a batch of records with one model call"""
+    features = _feature_matrix(records)
+    proba, labels = _score(model, features)
+    if not top_k:
+        start = perf_counter_ns()
+        results = [_build_result(p, l) for p, l in zip(proba, labels)]
+    else:
+        top, contributions, bias = _explain(explainer, features, top_k)
+        start = perf_counter_ns()
+        results = [_build_result(proba[i], labels[i], (features[i], top[i], contributions[i], bias[i]))
+                   for i in range(len(records))]
+    metrics.observe("heart", "postprocess", start)
+    return results
 
-try:
-    model = joblib.load(MODEL_PATH)
-    print(f"Model loaded from: {MODEL_PATH}")
-except Exception as e:
-    print(f"Failed to load model: {e}")
+def _load_models(top_k):
+    """The served heart model and, with top_k, the explainer booster; None if either is unavailable"""
+    model = registry.get("heart")
+    explainer = registry.get(EXPLAINER_NAME) if top_k else None
+    if model is None or (top_k and explainer is None):
+        return None
+    return model, explainer
 
-async def predict_heart_disease(data: dict):
-    """Predict heart disease using XGBoost"""
+def _cache_key(data: dict, top_k=0):
+    """Canonical key: model file version + the feature vector in schema order (+ explanation size)"""
+    explainer_version = registry.version(EXPLAINER_NAME) if top_k else None
+    return ("heart", registry.version("heart"), explainer_version, tuple(float(data[name]) for name in HEART_FEATURES),
+            top_k)
+
+async def predict_heart_disease(data: dict, top_k: int = 0):
+    """Predict heart disease using XGBoost; top_k > 0 adds that many TreeSHAP contributions"""
+    key = _cache_key(data, top_k)
+    cached = prediction_cache.get(key)
+    if cached is not None:
+        return cached
+    
     def _inference():
-        if model is None:
-            return {
-                "success": False,
-                "prediction": "Error",
-                "confidence": 0.0,
-                "details": {"message": "Model not loaded"}
-            }
-        
-        features = np.array([list(data.values())])
-        prediction = model.predict(features)[0]
-        proba = model.predict_proba(features)[0]
+        models = _load_models(top_k)
+        if models is None:
+            return MODEL_NOT_LOADED
         
-        risk_score = float(proba[1])
+        return _build_results(models[0], [data], top_k, models[1])[0]
+    
+    result = await timed_threadpool("heart", _inference)
+    metrics.count_result("heart", result)
+    if result["success"]:
+        prediction_cache.put(key, result)
+    return result
+
+async def predict_heart_disease_batch(records: list, top_k: int = 0):
+    """Score (and optionally explain) many patient records with one vectorized model call"""
+    def _inference():
+        models = _load_models(top_k)
+        if models is None:
+            return [MODEL_NOT_LOADED for _ in records]
         
-        return {
-            "success": True,
-            "prediction": "Low Risk" if prediction == 0 else "High Risk",
-            "confidence": float(max(proba)),
-            "details": {
-                "risk_percentage": round(risk_score * 100, 2),
-                "message": "Prediction from trained XGBoost model",
-                "top_risk_factors": ["cholesterol", "age", "trestbps"]
-            }
-        }
-    
-    return await run_in_threadpool(_inference)
+        return _build_results(models[0], records, top_k, models[1])
+    
+    results = await timed_threadpool("heart", _inference)
+    for result in results:
+        metrics.count_result("heart", result)
+    return results
+
+def score_heart_stream(model, text, fmt, chunk_rows=HEART_STREAM_CHUNK_ROWS):
+    """
+    Score a CSV/NDJSON text stream of patient records in fixed-size chunks,
+    one model call per chunk. Returns an iterator of result text in the same
+    format; raises ValueError for an unusable CSV header.
+    """
+    return score_stream(model, text, fmt, chunk_rows, _score)
+
+def score_heart_chunk(model, values, errors):
+    """Validate and score an (N, 13) chunk of parsed records with one model call"""
+    return score_chunk(model, values, errors, _score)
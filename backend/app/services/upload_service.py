@@ -0,0 +1,310 @@
+import hashlib
+import tempfile
+import zipfile
+from pathlib import PurePosixPath
+from typing import List
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from app.config import BULK_MAX_ITEMS, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES, MAX_JSON_BODY_BYTES
+
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed", "application/x-zip"}
+
+# Leading bytes of the image formats PIL can decode for us
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+]
+
+# Room for multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+NOT_AN_IMAGE = "File must be an image (JPEG, PNG, GIF, BMP, TIFF or WebP)"
+
+# Single-image routes whose upload is sniffed while the body streams in
+SNIFFED_ROUTES = ("/api/skin/predict", "/api/lung/predict")
+
+# Raw request bodies above this size are spooled to a temporary file
+SPOOL_MEMORY_BYTES = 1024 * 1024
+
+
+class UploadRejected(ValueError):
+    """A single upload (or archive member) that failed ingestion checks"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_image_type(header: bytes):
+    """Return the image format from the first bytes of a file, or None"""
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    for signature, kind in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return kind
+    return None
+
+
+def _check_image(header: bytes, size: int, max_bytes: int):
+    if size > max_bytes:
+        raise UploadRejected(f"File is too large ({size} bytes, limit {max_bytes})", status_code=413)
+    if sniff_image_type(header) is None:
+        raise UploadRejected(NOT_AN_IMAGE, status_code=415)
+
+
+def _file_size(file: UploadFile):
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, 2)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+async def ingest_upload(file: UploadFile, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Validate an uploaded image by size and magic bytes and return its
+    underlying file object, rewound, so the decoder reads it in place
+    instead of from an extra in-memory copy.
+    """
+    await file.seek(0)
+    header = await file.read(16)
+    await file.seek(0)
+    try:
+        _check_image(header, _file_size(file), max_bytes)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return file.file
+
+
+def upload_digest(source, chunk_size=1024 * 1024):
+    """SHA-256 of an upload given as bytes or a file object (left rewound)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(chunk_size), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+async def spool_request_body(request: Request):
+    """
+    Copy a raw request body into a temporary file (in memory up to
+    SPOOL_MEMORY_BYTES, then on disk) and return it rewound. The whole body
+    is received before any response is sent, so clients that upload fully
+    before reading (curl, urllib) cannot deadlock against a streamed reply.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(spool.write, chunk)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _is_zip(file: UploadFile):
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+def _is_hidden(name: str):
+    path = PurePosixPath(name)
+    return path.parts[0] == "__MACOSX" or path.name.startswith(".")
+
+def _too_many(max_items):
+    return HTTPException(status_code=413, detail=f"Too many images (max {max_items} per request)")
+
+def _zip_members(file: UploadFile, max_items=BULK_MAX_ITEMS):
+    """Yield (filename, member bytes or UploadRejected), extracting one member at a time"""
+    try:
+        with zipfile.ZipFile(file.file) as archive:
+            members = [m for m in archive.infolist() if not m.is_dir() and not _is_hidden(m.filename)]
+            if len(members) > max_items:
+                raise _too_many(max_items)
+            if sum(m.file_size for m in members) > MAX_BATCH_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="Archive expands beyond the batch upload limit")
+            
+            for m in members:
+                if m.file_size > MAX_UPLOAD_BYTES:
+                    yield m.filename, UploadRejected(
+                        f"File is too large ({m.file_size} bytes, limit {MAX_UPLOAD_BYTES})", status_code=413)
+                    continue
+                try:
+                    contents = archive.read(m)
+                except (zipfile.BadZipFile, NotImplementedError, OSError, RuntimeError) as e:
+                    # Corrupt, encrypted or unsupported-compression member: fail it alone
+                    yield m.filename, UploadRejected(f"Cannot extract archive member: {e}")
+                    continue
+                try:
+                    _check_image(contents[:16], len(contents), MAX_UPLOAD_BYTES)
+                    yield m.filename, contents
+                except UploadRejected as e:
+                    yield m.filename, e
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail=f"{file.filename}: not a valid zip archive")
+
+def _checked_file(file: UploadFile):
+    """The upload's file object, or an UploadRejected if it fails the size and magic-byte checks"""
+    file.file.seek(0)
+    header = file.file.read(16)
+    file.file.seek(0)
+    try:
+        _check_image(header, _file_size(file), MAX_UPLOAD_BYTES)
+    except UploadRejected as e:
+        return e
+    return file.file
+
+def iter_batch_uploads(files: List[UploadFile], max_items=BULK_MAX_ITEMS):
+    """
+    Lazily flatten multipart files and zip archives into (filename, source)
+    pairs, in order, reading one zip member at a time. `source` is a file
+    object, member bytes, or an UploadRejected for an item that failed
+    ingestion on its own. Blocking; run it in a worker thread.
+    """
+    count = 0
+    for file in files:
+        members = _zip_members(file, max_items) if _is_zip(file) else [(file.filename or f"file_{count}", file)]
+        for name, source in members:
+            count += 1
+            if count > max_items:
+                raise _too_many(max_items)
+            if source is file:
+                source = _checked_file(file)
+            yield name, source
+    
+    if count == 0:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+
+async def read_batch_uploads(files: List[UploadFile], max_items=BULK_MAX_ITEMS):
+    """iter_batch_uploads() as a list, for requests that score every item at once"""
+    return await run_in_threadpool(lambda: list(iter_batch_uploads(files, max_items)))
+
+
+def request_body_limit(path: str):
+    """Byte ceiling for a request body, or None for unbounded routes"""
+    if path == "/api/jobs":
+        return MAX_BATCH_UPLOAD_BYTES
+    if path.startswith(("/api/skin/", "/api/lung/")):
+        if path.endswith("/predict_batch"):
+            return MAX_BATCH_UPLOAD_BYTES
+        return MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
+    if path in ("/api/heart/predict", "/api/heart/predict_batch"):
+        return MAX_JSON_BODY_BYTES
+    return None
+
+
+def multipart_boundary(content_type: str):
+    """The boundary of a multipart/form-data Content-Type, as bytes, or None"""
+    media_type, _, params = content_type.partition(";")
+    if media_type.strip().lower() != "multipart/form-data":
+        return None
+    for param in params.split(";"):
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary" and value:
+            return value.strip('"').encode("latin-1")
+    return None
+
+
+class FirstFileSniffer:
+    """
+    Checks the magic bytes of the first file in a multipart body as the
+    body streams in, so a non-image upload is refused before the rest of it
+    is received and spooled. Gives up (leaving the check to ingest_upload)
+    if the first part is not a file or its headers are not found within
+    MULTIPART_OVERHEAD bytes.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.delimiter = b"--" + boundary
+        self.buffer = b""
+        self.done = False
+
+    def feed(self, chunk: bytes, more_body: bool):
+        """Raises UploadRejected (415) as soon as the first file is known not to be an image"""
+        if self.done:
+            return
+        self.buffer += chunk
+        start = self.buffer.find(self.delimiter)
+        headers_end = self.buffer.find(b"\r\n\r\n", start) if start >= 0 else -1
+        if headers_end < 0:
+            if len(self.buffer) > MULTIPART_OVERHEAD or not more_body:
+                self._finish()
+            return
+        if b"filename=" not in self.buffer[start:headers_end].lower():
+            self._finish()
+            return
+        
+        data = self.buffer[headers_end + 4:]
+        if len(data) < 16 and more_body:
+            return
+        end = data.find(b"\r\n" + self.delimiter)
+        header = data[:16] if end < 0 else data[:min(end, 16)]
+        self._finish()
+        if sniff_image_type(header) is None:
+            raise UploadRejected(NOT_AN_IMAGE, status_code=415)
+
+    def _finish(self):
+        self.done = True
+        self.buffer = b""
+
+
+class UploadLimitMiddleware:
+    """
+    Reject oversized upload bodies before they are buffered.
+
+    A declared Content-Length above the limit is refused without reading
+    the body. Otherwise the body is counted as it streams in, and reading
+    stops with 413 as soon as the limit is crossed. On the single-image
+    routes the file's magic bytes are checked from the first chunks too,
+    and a non-image stops the read with 415.
+    """
+
+    def __init__(self, app, limit_for=request_body_limit, sniffed_routes=SNIFFED_ROUTES):
+        self.app = app
+        self.limit_for = limit_for
+        self.sniffed_routes = sniffed_routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+        limit = self.limit_for(scope["path"])
+        if limit is None:
+            return await self.app(scope, receive, send)
+        
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                response = JSONResponse({"detail": f"Request body too large (limit {limit} bytes)"}, status_code=413)
+                return await response(scope, receive, send)
+        
+        received = 0
+        sniffer = None
+        if scope["path"] in self.sniffed_routes:
+            headers = dict(scope.get("headers", []))
+            boundary = multipart_boundary(headers.get(b"content-type", b"").decode("latin-1"))
+            sniffer = FirstFileSniffer(boundary) if boundary else None
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                received += len(body)
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=f"Request body too large (limit {limit} bytes)")
+                if sniffer is not None:
+                    try:
+                        sniffer.feed(body, message.get("more_body", False))
+                    except UploadRejected as e:
+                        raise HTTPException(status_code=e.status_code, detail=str(e))
+            return message
+        
+        await self.app(scope, limited_receive, send)
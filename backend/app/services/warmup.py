@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from app.config import WARMUP_ENABLED, WARMUP_ROUNDS, WARMUP_BATCH_SIZES, WARMUP_HEART_BATCH_SIZES
+from app.services.heart_stream import LOW, HIGH
+from app.services.image_service import SKIN_BATCHER, PNEUMONIA_BATCHER
+from app.services.model_registry import registry
+
+
+class Readiness:
+    """Warm-up progress behind GET /ready: not ready until every model's warm-up has finished"""
+
+    def __init__(self):
+        self.ready = False
+        self.seconds = None
+        self.models = {}
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "warmup_seconds": round(self.seconds, 3) if self.seconds is not None else None,
+            "models": self.models,
+        }
+
+
+readiness = Readiness()
+
+# Set at shutdown: warm-up calls already running in threadpool threads stop
+# at their next batch, so models are not used (or reloaded) after unloading
+warmup_stop = threading.Event()
+
+
+def _image_batch(batch_size):
+    return np.random.default_rng(0).integers(0, 256, (batch_size, 224, 224, 3), dtype=np.uint8)
+
+def _heart_batch(batch_size):
+    # Mid-range values for every feature
+    return np.tile(((LOW + HIGH) / 2).astype(np.float32), (batch_size, 1))
+
+# model -> (input builder, run(model, inputs), batch sizes). Image models run
+# through their batcher's run_batch, i.e. with the outputs that are served.
+WARMUPS = {
+    "skin": (_image_batch, lambda model, inputs: SKIN_BATCHER.run_batch(inputs), WARMUP_BATCH_SIZES),
+    "lung": (_image_batch, lambda model, inputs: PNEUMONIA_BATCHER.run_batch(inputs), WARMUP_BATCH_SIZES),
+    "heart": (_heart_batch, lambda model, inputs: model.predict_proba(inputs), WARMUP_HEART_BATCH_SIZES),
+}
+
+
+def warm_up_model(name, rounds=WARMUP_ROUNDS):
+    """
+    Load one model and run `rounds` inferences at each warm-up batch size.
+    Returns the first and last run time per batch size, or the load error.
+    Stops between inferences once `warmup_stop` is set.
+    """
+    build, run, batch_sizes = WARMUPS[name]
+    start = time.perf_counter()
+    if warmup_stop.is_set():
+        return {"warmed": False, "error": "Warm-up stopped"}
+    model = registry.get(name)
+    if model is None:
+        return {"warmed": False, "error": registry.status()[name]["error"]}
+
+    runs = {}
+    for batch_size in batch_sizes:
+        inputs = build(batch_size)
+        times = []
+        for _ in range(max(1, rounds)):
+            if warmup_stop.is_set():
+                return {"warmed": False, "error": "Warm-up stopped"}
+            run_start = time.perf_counter()
+            run(model, inputs)
+            times.append((time.perf_counter() - run_start) * 1000.0)
+        runs[str(batch_size)] = {"first_ms": round(times[0], 3), "last_ms": round(times[-1], 3)}
+    seconds = time.perf_counter() - start
+
+    details = ", ".join(f"batch {size}: first {r['first_ms']:.1f} ms, then {r['last_ms']:.1f} ms"
+                        for size, r in runs.items())
+    print(f"Warmed up {name} model in {seconds * 1000:.0f} ms ({details})")
+    return {"warmed": True, "seconds": round(seconds, 3), "runs": runs}
+
+
+async def warm_up(names=tuple(WARMUPS), enabled=WARMUP_ENABLED):
+    """
+    Warm every model up concurrently, then mark the server ready. Not meant
+    to be cancelled: that would leave its threadpool calls running. Set
+    `warmup_stop` and await it instead.
+    """
+    start = time.perf_counter()
+    if enabled and registry.mode == "lazy":
+        # Warming up would load every model, which lazy mode exists to avoid
+        print("Model loading is lazy; skipping warm-up")
+        enabled = False
+    if enabled:
+        results = await asyncio.gather(*[run_in_threadpool(warm_up_model, name) for name in names],
+                                       return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                print(f"WARNING: Warm-up of {name} model failed: {result}")
+                result = {"warmed": False, "error": str(result)}
+            readiness.models[name] = result
+    if warmup_stop.is_set():
+        return
+    readiness.seconds = time.perf_counter() - start
+    readiness.ready = True
+    if enabled:
+        print(f"Warm-up finished in {readiness.seconds:.2f}s; ready for traffic")
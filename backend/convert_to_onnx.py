@@ -1,12 +1,23 @@
 """
 Convert PyTorch .pth model to ONNX format
 Run this after training: python convert_to_onnx.py
+
+Optional INT8 post-training quantization (CPU serving):
+    python convert_to_onnx.py --quantize --calib-dir path/to/images [--eval-dir path/to/images]
+
+Fold the image preprocessing into the graph (skin or pneumonia model, FP32 or INT8),
+so the server feeds raw uint8 pixels:
+    python convert_to_onnx.py --fold-preprocessing [--model app/models/pneumonia_model.onnx] [--eval-dir path/to/images]
 """
 
-import torch
-import timm
+import argparse
+import shutil
+import tempfile
+import time
 from pathlib import Path
 
+import numpy as np
+
 # Paths
 PTH_PATH = Path("app/models/skin_cancer_best.pth")
 ONNX_PATH = Path("app/models/skin_cancer_model.onnx")
@@ -16,27 +27,41 @@ MODEL_NAME = "tf_efficientnetv2_s"
 NUM_CLASSES = 8
 IMG_SIZE = 224
 
+# Quantization defaults
+MIN_AGREEMENT = 0.98  # top-1 agreement with FP32 required to keep the INT8 model
+CALIB_LIMIT = 200
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Folded preprocessing must reproduce the Python preprocessing this closely
+PARITY_ATOL = 1e-4
+PARITY_SAMPLES = 16
+
 def convert():
+    import torch
+    import timm
+
     print("Converting PyTorch model to ONNX...")
-    
+
     # Check if .pth exists
     if not PTH_PATH.exists():
         print(f"ERROR: {PTH_PATH} not found!")
         return
-    
+
     # Load model architecture
     print("Loading model architecture...")
     model = timm.create_model(MODEL_NAME, pretrained=False, num_classes=NUM_CLASSES)
-    
+
     # Load trained weights
     print("Loading trained weights...")
     state_dict = torch.load(PTH_PATH, map_location='cpu')
     model.load_state_dict(state_dict)
     model.eval()
-    
+
     # Create dummy input
     dummy_input = torch.randn(1, 3, IMG_SIZE, IMG_SIZE)
-    
+
     # Export to ONNX
     print("Exporting to ONNX...")
     torch.onnx.export(
@@ -49,10 +74,299 @@ def convert():
         output_names=['output'],
         dynamic_axes={'input': {0: 'batch_size'}, 'output': {0: 'batch_size'}}
     )
-    
+
     print(f"Conversion complete!")
     print(f"ONNX model saved: {ONNX_PATH}")
     print(f"Model size: {ONNX_PATH.stat().st_size / (1024*1024):.2f} MB")
 
+# ============= INT8 QUANTIZATION =============
+def load_image_pixels(image_dir, limit=None):
+    """Resize images exactly like the server: (N, 224, 224, 3) uint8"""
+    from PIL import Image
+
+    paths = sorted(p for p in Path(image_dir).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if limit:
+        paths = paths[:limit]
+
+    pixels = [np.asarray(Image.open(path).convert("RGB").resize((IMG_SIZE, IMG_SIZE))) for path in paths]
+    if not pixels:
+        raise SystemExit(f"ERROR: no images found in {image_dir}")
+    return np.stack(pixels)
+
+def normalize(pixels):
+    """The server's Python normalization: (N, 224, 224, 3) uint8 -> (N, 3, 224, 224) float32"""
+    tensors = (pixels.astype(np.float32) / 255.0 - MEAN) / STD
+    return np.ascontiguousarray(np.transpose(tensors, (0, 3, 1, 2)))
+
+def load_image_tensors(image_dir, limit=None):
+    """Preprocess images exactly like the server: (N, 3, 224, 224) float32"""
+    return normalize(load_image_pixels(image_dir, limit))
+
+def serve_variable(model_path):
+    """Environment variable that selects this model file on the server"""
+    return "EDDS_LUNG_MODEL_FILE" if "pneumonia" in Path(model_path).name else "EDDS_SKIN_MODEL_FILE"
+
+def softmax(logits):
+    exp_logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp_logits / exp_logits.sum(axis=1, keepdims=True)
+
+def run_model(session, tensors, batch_size=32):
+    input_name = session.get_inputs()[0].name
+    outputs = [session.run(None, {input_name: tensors[i:i + batch_size]})[0] for i in range(0, len(tensors), batch_size)]
+    return np.concatenate(outputs)
+
+def measure_latency(session, tensor, runs=50, warmup=5):
+    """Mean single-image latency in ms"""
+    input_name = session.get_inputs()[0].name
+    for _ in range(warmup):
+        session.run(None, {input_name: tensor})
+    start = time.perf_counter()
+    for _ in range(runs):
+        session.run(None, {input_name: tensor})
+    return (time.perf_counter() - start) / runs * 1000
+
+def model_size_mb(path):
+    path = Path(path)
+    size = path.stat().st_size
+    data_file = path.with_name(path.name + ".data")
+    if data_file.exists():
+        size += data_file.stat().st_size
+    return size / (1024 * 1024)
+
+def quantize(model_path, output_path, calib_dir, eval_dir=None, min_agreement=MIN_AGREEMENT, calib_limit=CALIB_LIMIT):
+    """
+    Static INT8 quantization (QDQ, per-channel weights) calibrated on local
+    images. The quantized model is only written if its top-1 agreement with
+    the FP32 model on the evaluation images reaches `min_agreement`.
+    Returns True when the artifact was written.
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    model_path, output_path = Path(model_path), Path(output_path)
+    if not model_path.exists():
+        print(f"ERROR: {model_path} not found!")
+        return False
+
+    print(f"Loading calibration images from {calib_dir}...")
+    calib_tensors = load_image_tensors(calib_dir, calib_limit)
+    print(f"   {len(calib_tensors)} calibration images")
+
+    fp32_session = ort.InferenceSession(str(model_path), providers=["CPUExecutionProvider"])
+    input_name = fp32_session.get_inputs()[0].name
+
+    class ImageDirCalibrationReader(CalibrationDataReader):
+        def __init__(self, tensors):
+            self._batches = iter([{input_name: tensors[i:i + 1]} for i in range(len(tensors))])
+
+        def get_next(self):
+            return next(self._batches, None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = Path(tmp) / "prepared.onnx"
+        candidate = Path(tmp) / output_path.name
+
+        print("Running quantization pre-processing (shape inference + graph optimization)...")
+        try:
+            quant_pre_process(str(model_path), str(prepared))
+        except ImportError:
+            # Symbolic shape inference needs sympy; ONNX shape inference is enough for CNNs
+            print("WARNING: sympy not installed, skipping symbolic shape inference")
+            quant_pre_process(str(model_path), str(prepared), skip_symbolic_shape=True)
+
+        print("Quantizing to INT8 (static, QDQ, per-channel)...")
+        quantize_static(
+            str(prepared),
+            str(candidate),
+            ImageDirCalibrationReader(calib_tensors),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+        int8_session = ort.InferenceSession(str(candidate), providers=["CPUExecutionProvider"])
+
+        # Accuracy gate
+        if eval_dir:
+            eval_tensors = load_image_tensors(eval_dir)
+        else:
+            print("WARNING: no --eval-dir given, evaluating on the calibration images")
+            eval_tensors = calib_tensors
+
+        fp32_probs = softmax(run_model(fp32_session, eval_tensors))
+        int8_probs = softmax(run_model(int8_session, eval_tensors))
+        agreement = float(np.mean(fp32_probs.argmax(axis=1) == int8_probs.argmax(axis=1)))
+        deltas = np.abs(fp32_probs - int8_probs)
+
+        print(f"\nAccuracy vs FP32 ({len(eval_tensors)} images):")
+        print(f"   Top-1 agreement: {agreement:.2%} (required: {min_agreement:.2%})")
+        print(f"   {'Class':<8}{'mean |dp|':>12}{'max |dp|':>12}")
+        for i in range(deltas.shape[1]):
+            print(f"   {i:<8}{deltas[:, i].mean():>12.4f}{deltas[:, i].max():>12.4f}")
+
+        # Size and latency before/after
+        sample = eval_tensors[:1]
+        print(f"\n{'':<8}{'Size (MB)':>12}{'Latency (ms)':>14}")
+        print(f"{'FP32':<8}{model_size_mb(model_path):>12.2f}{measure_latency(fp32_session, sample):>14.2f}")
+        print(f"{'INT8':<8}{model_size_mb(candidate):>12.2f}{measure_latency(int8_session, sample):>14.2f}")
+
+        if agreement < min_agreement:
+            print(f"\nREJECTED: agreement below threshold, {output_path} was not written")
+            return False
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(candidate, output_path)
+
+    print(f"\nINT8 model saved: {output_path}")
+    print(f"Serve it with: {serve_variable(model_path)}={output_path.name}")
+    return True
+
+# ============= PREPROCESSING FOLDING =============
+def add_preprocessing(model):
+    """
+    Prepend the server's preprocessing to an image model graph in place. The
+    new 'input' takes raw (N, 224, 224, 3) uint8 pixels, which are transposed
+    to NCHW, cast to float32, divided by 255 and normalized with the ImageNet
+    mean/std: the same float32 operations, in the same order, as normalize().
+    """
+    from onnx import TensorProto, helper, numpy_helper
+
+    graph = model.graph
+    pixels = graph.input[0]
+    normalized = pixels.name + "_normalized"
+    for node in graph.node:
+        for i, name in enumerate(node.input):
+            if name == pixels.name:
+                node.input[i] = normalized
+
+    graph.initializer.extend([
+        numpy_helper.from_array(np.array(255.0, dtype=np.float32), "preprocess_scale"),
+        numpy_helper.from_array(MEAN.reshape(1, 3, 1, 1), "preprocess_mean"),
+        numpy_helper.from_array(STD.reshape(1, 3, 1, 1), "preprocess_std"),
+    ])
+    preprocess = [
+        helper.make_node("Transpose", [pixels.name], ["preprocess_nchw"], perm=[0, 3, 1, 2]),
+        helper.make_node("Cast", ["preprocess_nchw"], ["preprocess_float"], to=TensorProto.FLOAT),
+        helper.make_node("Div", ["preprocess_float", "preprocess_scale"], ["preprocess_scaled"]),
+        helper.make_node("Sub", ["preprocess_scaled", "preprocess_mean"], ["preprocess_centered"]),
+        helper.make_node("Div", ["preprocess_centered", "preprocess_std"], [normalized]),
+    ]
+    nodes = preprocess + list(graph.node)
+    del graph.node[:]
+    graph.node.extend(nodes)
+
+    # Same name and batch dimension, uint8 NHWC
+    batch_dim = pixels.type.tensor_type.shape.dim[0]
+    batch = batch_dim.dim_param or batch_dim.dim_value or "batch_size"
+    pixels.CopyFrom(helper.make_tensor_value_info(pixels.name, TensorProto.UINT8, [batch, IMG_SIZE, IMG_SIZE, 3]))
+
+def check_parity(model_path, folded_path, pixels):
+    """
+    Run the original model on Python-preprocessed pixels and the folded
+    model on the raw pixels. Returns (max |diff| per output, top-1 agreement).
+    """
+    import onnxruntime as ort
+
+    original = ort.InferenceSession(str(model_path), providers=["CPUExecutionProvider"])
+    folded = ort.InferenceSession(str(folded_path), providers=["CPUExecutionProvider"])
+    input_name = original.get_inputs()[0].name
+    expected = original.run(None, {input_name: normalize(pixels)})
+    actual = folded.run(None, {input_name: pixels})
+
+    diffs = {out.name: float(np.max(np.abs(e - a))) for out, e, a in zip(original.get_outputs(), expected, actual)}
+    agreement = float(np.mean(expected[0].argmax(axis=1) == actual[0].argmax(axis=1)))
+    return diffs, agreement
+
+def fold_preprocessing(model_path, output_path, eval_dir=None):
+    """
+    Write a copy of an image model that takes uint8 pixels (see
+    add_preprocessing). The copy is only written if it matches the original
+    model fed with Python preprocessing to within PARITY_ATOL on every
+    output, on the evaluation images (or random pixels if none are given).
+    Returns True when the artifact was written.
+    """
+    import onnx
+    from onnx import TensorProto
+
+    model_path, output_path = Path(model_path), Path(output_path)
+    if not model_path.exists():
+        print(f"ERROR: {model_path} not found!")
+        return False
+
+    model = onnx.load(str(model_path))
+    input_type = model.graph.input[0].type.tensor_type.elem_type
+    if input_type == TensorProto.UINT8:
+        print(f"ERROR: {model_path} already takes uint8 pixels")
+        return False
+    if input_type != TensorProto.FLOAT:
+        print(f"ERROR: {model_path} input is not float32")
+        return False
+
+    print(f"Folding preprocessing into {model_path}...")
+    add_preprocessing(model)
+
+    if eval_dir:
+        pixels = load_image_pixels(eval_dir, PARITY_SAMPLES)
+    else:
+        print("WARNING: no --eval-dir given, checking parity on random pixels")
+        pixels = np.random.default_rng(0).integers(0, 256, (PARITY_SAMPLES, IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)
+
+    # Large models keep their weights in an external .data file, like the source
+    external = model_path.with_name(model_path.name + ".data").exists()
+    with tempfile.TemporaryDirectory() as tmp:
+        candidate = Path(tmp) / output_path.name
+        onnx.save_model(model, str(candidate), save_as_external_data=external,
+                        all_tensors_to_one_file=True, location=output_path.name + ".data")
+        onnx.checker.check_model(str(candidate))
+
+        diffs, agreement = check_parity(model_path, candidate, pixels)
+        print(f"\nParity with Python preprocessing ({len(pixels)} images):")
+        for name, diff in diffs.items():
+            print(f"   {name:<14} max |diff| {diff:.2e} (allowed: {PARITY_ATOL:.0e})")
+        print(f"   Top-1 agreement: {agreement:.2%}")
+
+        if max(diffs.values()) > PARITY_ATOL or agreement < 1.0:
+            print(f"\nREJECTED: outputs differ, {output_path} was not written")
+            return False
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(candidate, output_path)
+        if external:
+            shutil.copyfile(candidate.with_name(candidate.name + ".data"),
+                            output_path.with_name(output_path.name + ".data"))
+
+    print(f"\nuint8 model saved: {output_path}")
+    print(f"Serve it with: {serve_variable(model_path)}={output_path.name}")
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the skin cancer model to ONNX and optionally quantize it to INT8")
+    parser.add_argument("--quantize", action="store_true", help="Quantize an existing ONNX model instead of exporting")
+    parser.add_argument("--fold-preprocessing", action="store_true",
+                        help="Prepend the image preprocessing to an existing ONNX model (uint8 NHWC input)")
+    parser.add_argument("--model", default=str(ONNX_PATH), help="ONNX model to quantize or fold preprocessing into")
+    parser.add_argument("--output", help="Output path (default: <model>.int8.onnx or <model>.uint8.onnx)")
+    parser.add_argument("--calib-dir", help="Directory of calibration images")
+    parser.add_argument("--eval-dir", help="Directory of evaluation images (default: calibration images)")
+    parser.add_argument("--calib-limit", type=int, default=CALIB_LIMIT, help="Maximum calibration images")
+    parser.add_argument("--min-agreement", type=float, default=MIN_AGREEMENT, help="Required top-1 agreement with FP32")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.quantize:
+        if not args.calib_dir:
+            raise SystemExit("ERROR: --quantize needs --calib-dir")
+        model = Path(args.model)
+        output = Path(args.output) if args.output else model.with_name(model.stem + ".int8.onnx")
+        ok = quantize(model, output, args.calib_dir, args.eval_dir, args.min_agreement, args.calib_limit)
+        raise SystemExit(0 if ok else 1)
+    if args.fold_preprocessing:
+        model = Path(args.model)
+        output = Path(args.output) if args.output else model.with_name(model.stem + ".uint8.onnx")
+        raise SystemExit(0 if fold_preprocessing(model, output, args.eval_dir) else 1)
     convert()
@@ -0,0 +1,22 @@
+"""
+Multi-worker serving with models shared between workers (used by the Procfile):
+    gunicorn app.main:app -c gunicorn.conf.py
+
+The app (and the fork-safe models in EDDS_PRELOAD_MODELS) is loaded once in
+the master, and the forked workers share those pages copy-on-write. ONNX
+models load in each worker; set EDDS_ORT_SHARED_WEIGHTS=1 so their weights
+are mapped copy-on-write from one file and shared through the page cache instead.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def on_starting(server):
+    from app.config import PRELOAD_MODELS
+    from app.services.model_registry import registry
+    registry.preload(PRELOAD_MODELS)
@@ -0,0 +1,330 @@
+"""
+End-to-end HTTP load test with synthetic inputs (no network, no datasets)
+
+Starts the API locally (or targets --url), generates synthetic JPEG/PNG
+images and valid HeartDiseaseInput records, drives the predict endpoints and
+writes throughput plus p50/p95/p99 latency per endpoint to a JSON file.
+
+Examples:
+    python load_test.py --concurrency 8 --duration 30
+    python load_test.py --rate 50 --duration 60 --endpoints heart
+    python load_test.py --url http://localhost:8000 --image-sizes 224,2048 --formats jpeg
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+ENDPOINTS = {
+    "skin": "/api/skin/predict",
+    "lung": "/api/lung/predict",
+    "heart": "/api/heart/predict",
+}
+
+# ============= SYNTHETIC INPUTS =============
+def synthetic_image(size, fmt, grayscale, rng):
+    """Smooth random image; grayscale mid-brightness ones pass the X-ray check"""
+    low = rng.integers(0, 256, size=(8, 8) if grayscale else (8, 8, 3), dtype=np.uint8)
+    img = Image.fromarray(low).resize((size, size), Image.BILINEAR)
+    if grayscale:
+        img = Image.fromarray((np.array(img, dtype=np.float32) * 0.5 + 64).astype(np.uint8))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG" if fmt == "jpeg" else "PNG", quality=90)
+    return buffer.getvalue()
+
+def image_pool(sizes, formats, grayscale, pool_size, seed):
+    """Pre-encoded (filename, content_type, bytes) uploads, cycled through during the run"""
+    rng = np.random.default_rng(seed)
+    variants = list(itertools.product(sizes, formats))
+    pool = []
+    for i in range(max(pool_size, len(variants))):
+        size, fmt = variants[i % len(variants)]
+        ext, content_type = ("jpg", "image/jpeg") if fmt == "jpeg" else ("png", "image/png")
+        pool.append((f"synthetic_{size}_{i}.{ext}", content_type, synthetic_image(size, fmt, grayscale, rng)))
+    return pool
+
+def heart_pool(pool_size, seed):
+    """Random HeartDiseaseInput payloads within the schema's ge/le bounds"""
+    from app.schemas.models import HeartDiseaseInput
+
+    rng = random.Random(seed)
+    pool = []
+    for _ in range(pool_size):
+        record = {}
+        for name, field in HeartDiseaseInput.model_fields.items():
+            low = next(m.ge for m in field.metadata if hasattr(m, "ge"))
+            high = next(m.le for m in field.metadata if hasattr(m, "le"))
+            record[name] = rng.randint(low, high) if field.annotation is int else round(rng.uniform(low, high), 1)
+        HeartDiseaseInput(**record)
+        pool.append(json.dumps(record).encode())
+    return pool
+
+def multipart(filename, content_type, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+def build_requests(endpoints, args):
+    """Per endpoint: an endless cycle of (body, content_type)"""
+    sizes = [int(s) for s in args.image_sizes.split(",")]
+    formats = [f.strip().lower() for f in args.formats.split(",")]
+    bodies = {}
+    for name in endpoints:
+        if name == "heart":
+            bodies[name] = [(body, "application/json") for body in heart_pool(args.pool, args.seed)]
+        else:
+            images = image_pool(sizes, formats, name == "lung", args.pool, args.seed)
+            bodies[name] = [multipart(*image) for image in images]
+    return {name: itertools.cycle(items) for name, items in bodies.items()}
+
+# ============= SERVER =============
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_ready(url, process=None, timeout=120):
+    """Poll /ready until warm-up has finished (200), then return /health"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"ERROR: server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url + "/ready", timeout=2):
+                pass
+            with urllib.request.urlopen(url + "/health", timeout=10) as response:
+                return json.loads(response.read())
+        except (urllib.error.URLError, ConnectionError, OSError):
+            # 503 (still warming up) raises HTTPError, a URLError
+            time.sleep(0.25)
+    if process is not None:
+        process.terminate()
+    raise SystemExit("ERROR: server did not become ready in time")
+
+def start_server(port, cache, timeout=120):
+    """Run uvicorn on localhost in a child process and wait until it is ready"""
+    env = dict(os.environ)
+    if not cache:
+        # Every synthetic image repeats; measure the pipeline, not the cache
+        env.setdefault("EDDS_CACHE_ENABLED", "0")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=Path(__file__).parent, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    return process, url, wait_until_ready(url, process, timeout)
+
+# ============= LOAD GENERATION =============
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, latency, status, success):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            counts = self.statuses.setdefault(endpoint, {})
+            counts[str(status)] = counts.get(str(status), 0) + 1
+            if not success:
+                self.failures[endpoint] = self.failures.get(endpoint, 0) + 1
+
+def send(url, endpoint, body, content_type, timeout):
+    """POST once; returns (status, success) where success is the API's own flag"""
+    request = urllib.request.Request(url + ENDPOINTS[endpoint], data=body, headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.loads(response.read())
+            return response.status, bool(payload.get("success"))
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, False
+    except (urllib.error.URLError, OSError):
+        return "connection_error", False
+
+def run_closed_loop(url, requests, endpoints, recorder, concurrency, duration, timeout):
+    """`concurrency` workers per endpoint, each sending its next request as soon as the last one returns"""
+    stop_at = time.perf_counter() + duration
+    lock = threading.Lock()
+
+    def worker(endpoint):
+        while time.perf_counter() < stop_at:
+            with lock:
+                body, content_type = next(requests[endpoint])
+            start = time.perf_counter()
+            status, success = send(url, endpoint, body, content_type, timeout)
+            recorder.record(endpoint, time.perf_counter() - start, status, success)
+
+    threads = [threading.Thread(target=worker, args=(e,)) for e in endpoints for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def run_open_loop(url, requests, endpoints, recorder, rate, duration, timeout, max_inflight, seed):
+    """
+    Poisson arrivals at `rate` requests/s per endpoint, independent of how
+    fast the server answers. Latency is measured from the scheduled arrival
+    time, so queueing delay is not hidden (no coordinated omission).
+    """
+    rng = random.Random(seed)
+    schedule = []
+    for endpoint in endpoints:
+        t = 0.0
+        while True:
+            t += rng.expovariate(rate)
+            if t >= duration:
+                break
+            schedule.append((t, endpoint))
+    schedule.sort()
+
+    def fire(scheduled, endpoint, body, content_type):
+        status, success = send(url, endpoint, body, content_type, timeout)
+        recorder.record(endpoint, time.perf_counter() - scheduled, status, success)
+
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        start = time.perf_counter()
+        for offset, endpoint in schedule:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            body, content_type = next(requests[endpoint])
+            pool.submit(fire, start + offset, endpoint, body, content_type)
+
+# ============= REPORT =============
+def summarize(recorder, elapsed):
+    report = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        ms = np.array(latencies) * 1000
+        report[endpoint] = {
+            "requests": len(latencies),
+            "failures": recorder.failures.get(endpoint, 0),
+            "status_codes": recorder.statuses[endpoint],
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "latency_ms": {
+                "mean": round(float(ms.mean()), 2),
+                "p50": round(float(np.percentile(ms, 50)), 2),
+                "p95": round(float(np.percentile(ms, 95)), 2),
+                "p99": round(float(np.percentile(ms, 99)), 2),
+                "max": round(float(ms.max()), 2),
+            },
+        }
+    return report
+
+def run_phase(url, requests, endpoints, args, duration):
+    """Drive load for `duration` seconds; returns (Recorder, elapsed seconds)"""
+    recorder = Recorder()
+    start = time.perf_counter()
+    if args.rate:
+        run_open_loop(url, requests, endpoints, recorder, args.rate, duration, args.timeout, args.max_inflight, args.seed)
+    else:
+        run_closed_loop(url, requests, endpoints, recorder, args.concurrency, duration, args.timeout)
+    return recorder, time.perf_counter() - start
+
+def positive_float(value):
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the EDDS predict endpoints with synthetic inputs")
+    parser.add_argument("--url", help="Target a running server instead of starting one")
+    parser.add_argument("--endpoints", default="skin,lung,heart", help="Comma-separated subset of: skin, lung, heart")
+    parser.add_argument("--concurrency", type=int, default=4, help="Closed loop: concurrent clients per endpoint")
+    parser.add_argument("--rate", type=float, help="Open loop: requests/s per endpoint (overrides --concurrency)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Open loop: cap on outstanding requests")
+    parser.add_argument("--duration", type=positive_float, default=20.0, help="Seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of unmeasured load first")
+    parser.add_argument("--image-sizes", default="224,1024", help="Square image sizes in pixels")
+    parser.add_argument("--formats", default="jpeg,png", help="Image formats: jpeg, png")
+    parser.add_argument("--pool", type=int, default=32, help="Distinct synthetic inputs per endpoint")
+    parser.add_argument("--cache", action="store_true", help="Keep the prediction cache on in the started server")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test_results.json", help="JSON report path")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        raise SystemExit(f"ERROR: unknown endpoints: {', '.join(unknown)}")
+
+    print("Generating synthetic inputs...")
+    requests = build_requests(endpoints, args)
+
+    process = None
+    if args.url:
+        url = args.url.rstrip("/")
+        health = wait_until_ready(url)
+    else:
+        print("Starting server...")
+        process, url, health = start_server(free_port(), args.cache)
+    missing = [e for e in endpoints if not health.get("models_loaded", {}).get(e, True)]
+    if missing:
+        print(f"WARNING: models not loaded: {', '.join(missing)} (their requests will fail fast)")
+
+    mode = f"open loop, {args.rate} req/s per endpoint" if args.rate else f"closed loop, {args.concurrency} clients per endpoint"
+    print(f"Load testing {', '.join(endpoints)} at {url} ({mode})")
+    try:
+        if args.warmup > 0:
+            run_phase(url, requests, endpoints, args, args.warmup)
+        measured, elapsed = run_phase(url, requests, endpoints, args, args.duration)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    results = summarize(measured, elapsed)
+    report = {
+        "config": {
+            "mode": "open" if args.rate else "closed",
+            "rate": args.rate,
+            "concurrency": None if args.rate else args.concurrency,
+            "duration_s": args.duration,
+            "image_sizes": args.image_sizes,
+            "formats": args.formats,
+            "cache": args.cache if process is not None else "external server",
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "elapsed_s": round(elapsed, 3),
+        "endpoints": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+
+    print(f"\n{'Endpoint':<8}{'Requests':>10}{'Failed':>8}{'RPS':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, r in results.items():
+        lat = r["latency_ms"]
+        print(f"{endpoint:<8}{r['requests']:>10}{r['failures']:>8}{r['throughput_rps']:>9.1f}"
+              f"{lat['p50']:>10.1f}{lat['p95']:>10.1f}{lat['p99']:>10.1f}")
+    print(f"\nReport saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
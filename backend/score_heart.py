@@ -0,0 +1,102 @@
+"""
+Bulk heart disease scoring for CSV or NDJSON files of any size
+
+Reads patient records (CSV with a header row naming the HeartDiseaseInput
+columns, or one JSON object per line) in fixed-size chunks, validates and
+scores each chunk with one model call and writes one result per row in the
+same format. Scores locally with the server's model files, or streams the
+file to a running server's /api/heart/predict_stream with --url.
+
+Examples:
+    python score_heart.py registry.csv -o scores.csv
+    python score_heart.py records.ndjson --chunk-rows 8192 > scores.ndjson
+    python score_heart.py registry.csv --url http://localhost:8000 -o scores.csv
+"""
+
+import argparse
+import http.client
+import os
+import shutil
+import sys
+import time
+import urllib.parse
+
+CONTENT_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def input_format(path, requested):
+    if requested:
+        return requested
+    if path.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if path.lower().endswith(".csv"):
+        return "csv"
+    with open(path, "rb") as f:
+        return "ndjson" if f.read(512).lstrip().startswith(b"{") else "csv"
+
+
+def score_local(path, fmt, out, chunk_rows):
+    from app.services.model_registry import registry
+    from app.services.tabular_service import score_heart_stream
+
+    model = registry.get("heart")
+    if model is None:
+        raise SystemExit("ERROR: heart model could not be loaded")
+
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as text:
+        try:
+            results = score_heart_stream(model, text, fmt, chunk_rows)
+        except ValueError as e:
+            raise SystemExit(f"ERROR: {e}")
+        for piece in results:
+            out.write(piece.encode())
+
+
+def score_remote(url, path, fmt, out):
+    target = urllib.parse.urlsplit(url.rstrip("/") + "/api/heart/predict_stream")
+    connection_class = http.client.HTTPSConnection if target.scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(target.netloc, timeout=None, blocksize=1024 * 1024)
+
+    # The file is sent straight from disk and the reply copied straight out
+    with open(path, "rb") as body:
+        connection.request("POST", f"{target.path}?format={fmt}", body=body, headers={
+            "Content-Type": CONTENT_TYPES[fmt],
+            "Content-Length": str(os.fstat(body.fileno()).st_size),
+        })
+        response = connection.getresponse()
+        if response.status != 200:
+            raise SystemExit(f"ERROR: server returned {response.status}: {response.read().decode(errors='replace')}")
+        shutil.copyfileobj(response, out, 1024 * 1024)
+    connection.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Score a CSV/NDJSON file of heart disease records")
+    parser.add_argument("input", help="CSV (with header row) or NDJSON file")
+    parser.add_argument("-o", "--output", help="Results file (default: stdout)")
+    parser.add_argument("--format", choices=sorted(CONTENT_TYPES), help="Input format (default: from the file)")
+    parser.add_argument("--url", help="Score on a running server instead of locally")
+    parser.add_argument("--chunk-rows", type=int, help="Rows per model call (local scoring only)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    fmt = input_format(args.input, args.format)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+
+    start = time.perf_counter()
+    try:
+        if args.url:
+            score_remote(args.url, args.input, fmt, out)
+        else:
+            from app.config import HEART_STREAM_CHUNK_ROWS
+            score_local(args.input, fmt, out, args.chunk_rows or HEART_STREAM_CHUNK_ROWS)
+    finally:
+        if args.output:
+            out.close()
+    print(f"Scored {args.input} in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,9 @@ import numpy as np
 from pathlib import Path
 
 MODEL_PATH = Path("app/models/skin_cancer_model.onnx")
+# Written by: python convert_to_onnx.py --fold-preprocessing
+FOLDED_PATHS = [Path("app/models/skin_cancer_model.uint8.onnx"), Path("app/models/pneumonia_model.uint8.onnx")]
+PARITY_ATOL = 1e-4
 
 def test_model():
     print("Testing Skin Cancer Model Integration\n")
@@ -42,7 +45,11 @@ def test_model():
         
         # Test inference with dummy data
         print("\nRunning test inference...")
-        dummy_input = np.random.randn(1, 3, 224, 224).astype(np.float32)
+        if input_info.type == "tensor(uint8)":
+            # Preprocessing folded into the graph: raw HWC pixels
+            dummy_input = np.random.randint(0, 256, (1, 224, 224, 3), dtype=np.uint8)
+        else:
+            dummy_input = np.random.randn(1, 3, 224, 224).astype(np.float32)
         outputs = session.run(None, {'input': dummy_input})
         
         logits = outputs[0][0]
@@ -68,5 +75,37 @@ def test_model():
     except Exception as e:
         print(f"ERROR: {e}")
 
+def test_folded_preprocessing():
+    """Each uint8 model must match its float model fed by the server's Python preprocessing"""
+    from app.services.image_service import model_input
+    
+    for folded_path in FOLDED_PATHS:
+        model_path = folded_path.with_name(folded_path.name.replace(".uint8.onnx", ".onnx"))
+        if not (folded_path.exists() and model_path.exists()):
+            continue
+        
+        model_name = "lung" if model_path.name.startswith("pneumonia") else "skin"
+        print(f"\nChecking {folded_path.name} against {model_path.name}...")
+        try:
+            original = ort.InferenceSession(str(model_path))
+            folded = ort.InferenceSession(str(folded_path))
+            pixels = np.random.randint(0, 256, (8, 224, 224, 3), dtype=np.uint8)
+            with model_input(original, pixels, model_name) as inputs:
+                expected = original.run(None, {'input': inputs})
+            with model_input(folded, pixels, model_name) as inputs:
+                actual = folded.run(None, {'input': inputs})
+            
+            for output, e, a in zip(original.get_outputs(), expected, actual):
+                diff = float(np.max(np.abs(e - a)))
+                status = "OK" if diff <= PARITY_ATOL else "MISMATCH"
+                print(f"   {output.name}: max |diff| {diff:.2e} {status}")
+            if all(np.allclose(e, a, rtol=0, atol=PARITY_ATOL) for e, a in zip(expected, actual)):
+                print("Folded preprocessing matches the Python preprocessing")
+            else:
+                print("ERROR: Folded model outputs differ; re-run convert_to_onnx.py --fold-preprocessing")
+        except Exception as e:
+            print(f"ERROR: {e}")
+
 if __name__ == "__main__":
     test_model()
+    test_folded_preprocessing()
@@ -31,7 +31,7 @@ export default function HeartDisease() {
     e.preventDefault()
     setLoading(true)
     try {
-      const { data } = await axios.post(`${API_BASE_URL}/api/heart/predict`, formData)
+      const { data } = await axios.post(`${API_BASE_URL}/api/heart/predict`, formData, { params: { explain: true } })
       setResult(data)
     } catch (error) {
       console.error(error)
@@ -180,7 +180,7 @@ export default function HeartDisease() {
                 </div>
 
                 {/* Top Risk Factors */}
-                {result.details?.top_risk_factors && (
+                {result.details?.top_risk_factors?.length > 0 && (
                   <div className="glass p-4 rounded-xl">
                     <span className="text-white/60 text-xs uppercase tracking-wide block mb-3">Key Risk Factors</span>
                     <div className="space-y-1.5">
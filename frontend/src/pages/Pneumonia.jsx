@@ -28,7 +28,7 @@ export default function Pneumonia() {
     formData.append('file', image)
 
     try {
-      const { data } = await axios.post(`${API_BASE_URL}/api/lung/predict`, formData)
+      const { data } = await axios.post(`${API_BASE_URL}/api/lung/predict?heatmap=true`, formData)
       setResult(data)
     } catch (error) {
       console.error(error)
@@ -127,10 +127,10 @@ export default function Pneumonia() {
                 </div>
               </div>
 
-              {result.heatmap && (
+              {result.heatmap_url && (
                 <div className="glass p-4 rounded-xl">
                   <span className="text-white/60 text-xs uppercase tracking-wide mb-2 block">Grad-CAM Heatmap</span>
-                  <img src={result.heatmap} alt="Heatmap" className="rounded-xl w-full shadow-lg" />
+                  <img src={`${API_BASE_URL}${result.heatmap_url}`} alt="Heatmap" className="rounded-xl w-full shadow-lg" />
                   <p className="text-white/50 text-xs mt-2">Red areas indicate regions of interest for diagnosis</p>
                 </div>
               )}
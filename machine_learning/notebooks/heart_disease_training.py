@@ -4,11 +4,148 @@ import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 import joblib
+import json
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(BASE_DIR, "../datasets/heart_disease/heart.csv")
 MODEL_SAVE_PATH = os.path.join(BASE_DIR, "../trained_models/heart_disease_model.pkl")
+ONNX_SAVE_PATH = os.path.join(BASE_DIR, "../trained_models/heart_disease_model.onnx")
+
+# The server's float32 sigmoid, so the parity check tests exactly what is served
+sys.path.insert(0, os.path.join(BASE_DIR, "../../backend"))
+from app.services.sigmoid import xgboost_sigmoid
+
+# ============= ONNX EXPORT =============
+# The booster is written as a single ai.onnx.ml TreeEnsembleRegressor that
+# outputs the raw margin; the server applies the sigmoid. Summing the trees
+# in order in float32, with the base margin folded into the first tree's
+# leaves, reproduces XGBoost's own accumulation exactly.
+
+def booster_to_onnx(model):
+    from onnx import helper, TensorProto
+    
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+    if learner["objective"]["name"] != "binary:logistic":
+        raise ValueError(f"Unsupported objective: {learner['objective']['name']}")
+    
+    # XGBoost's ProbToMargin for the logistic objective, in float32
+    base_score = np.float32(json.loads(learner["learner_model_param"]["base_score"])[0])
+    base_margin = -np.log(np.float32(1) / base_score - np.float32(1))
+    
+    attrs = {k: [] for k in (
+        "nodes_treeids", "nodes_nodeids", "nodes_featureids", "nodes_values", "nodes_modes",
+        "nodes_truenodeids", "nodes_falsenodeids", "nodes_missing_value_tracks_true",
+        "target_treeids", "target_nodeids", "target_ids", "target_weights")}
+    
+    for tree_id, tree in enumerate(learner["gradient_booster"]["model"]["trees"]):
+        nodes = zip(tree["left_children"], tree["right_children"], tree["split_indices"],
+                    tree["split_conditions"], tree["default_left"])
+        for node_id, (left, right, feature, condition, default_left) in enumerate(nodes):
+            attrs["nodes_treeids"].append(tree_id)
+            attrs["nodes_nodeids"].append(node_id)
+            if left == -1:
+                # Leaf: split_conditions holds the leaf value
+                weight = np.float32(condition)
+                if tree_id == 0:
+                    weight = np.float32(base_margin + weight)
+                attrs["nodes_featureids"].append(0)
+                attrs["nodes_values"].append(0.0)
+                attrs["nodes_modes"].append("LEAF")
+                attrs["nodes_truenodeids"].append(0)
+                attrs["nodes_falsenodeids"].append(0)
+                attrs["nodes_missing_value_tracks_true"].append(0)
+                attrs["target_treeids"].append(tree_id)
+                attrs["target_nodeids"].append(node_id)
+                attrs["target_ids"].append(0)
+                attrs["target_weights"].append(float(weight))
+            else:
+                # XGBoost sends x < threshold to the left child
+                attrs["nodes_featureids"].append(feature)
+                attrs["nodes_values"].append(float(np.float32(condition)))
+                attrs["nodes_modes"].append("BRANCH_LT")
+                attrs["nodes_truenodeids"].append(left)
+                attrs["nodes_falsenodeids"].append(right)
+                attrs["nodes_missing_value_tracks_true"].append(int(default_left))
+    
+    n_features = int(learner["learner_model_param"]["num_feature"])
+    node = helper.make_node(
+        "TreeEnsembleRegressor", ["input"], ["margin"], domain="ai.onnx.ml",
+        n_targets=1, base_values=[0.0], aggregate_function="SUM", post_transform="NONE", **attrs
+    )
+    graph = helper.make_graph(
+        [node], "heart_disease_xgboost",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [None, n_features])],
+        [helper.make_tensor_value_info("margin", TensorProto.FLOAT, [None, 1])],
+    )
+    onnx_model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17), helper.make_opsetid("ai.onnx.ml", 3)])
+    onnx_model.ir_version = 8
+    feature_names = booster.feature_names or [f"f{i}" for i in range(n_features)]
+    helper.set_model_props(onnx_model, {"feature_names": ",".join(feature_names)})
+    return onnx_model
+
+def check_parity(model, onnx_model, X):
+    """Margins and both class probabilities must match the pickle bit for bit"""
+    import onnxruntime as ort
+    
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = 1  # keep the tree sum in order
+    session = ort.InferenceSession(onnx_model.SerializeToString(), options, providers=["CPUExecutionProvider"])
+    X = np.asarray(X, dtype=np.float32)
+    
+    margin = session.run(None, {"input": X})[0][:, 0]
+    ref_margin = model.get_booster().inplace_predict(X, predict_type="margin")
+    p1 = xgboost_sigmoid(margin)
+    proba = np.stack([np.float32(1) - p1, p1], axis=1)
+    ref_proba = model.predict_proba(X)
+    
+    margin_ok = np.array_equal(margin, ref_margin)
+    proba_ok = np.array_equal(proba, ref_proba)
+    print(f"   Margin parity:      {'bit-exact' if margin_ok else f'max diff {np.abs(margin - ref_margin).max():.3g}'} ({len(X)} rows)")
+    print(f"   Probability parity: {'bit-exact' if proba_ok else f'max diff {np.abs(proba - ref_proba).max():.3g}'}")
+    return margin_ok and proba_ok
+
+def random_records(model, n, seed=0):
+    """Random feature rows spanning every split threshold of the booster"""
+    learner = json.loads(model.get_booster().save_raw(raw_format="json"))["learner"]
+    n_features = int(learner["learner_model_param"]["num_feature"])
+    thresholds = [[] for _ in range(n_features)]
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+        for left, feature, condition in zip(tree["left_children"], tree["split_indices"], tree["split_conditions"]):
+            if left != -1:
+                thresholds[feature].append(condition)
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n, n_features), dtype=np.float32)
+    for i, values in enumerate(thresholds):
+        low, high = (min(values) - 1, max(values) + 1) if values else (0, 1)
+        X[:, i] = rng.uniform(low, high, n)
+        # Exact threshold values exercise the x < threshold boundary
+        if values:
+            X[::7, i] = rng.choice(values, len(X[::7]))
+    return X
+
+def export_onnx(model, X_check, path=ONNX_SAVE_PATH):
+    import onnx
+    
+    print("\nExporting model to ONNX (TreeEnsembleRegressor)...")
+    onnx_model = booster_to_onnx(model)
+    if not check_parity(model, onnx_model, np.concatenate([np.asarray(X_check, dtype=np.float32), random_records(model, 20000)])):
+        print("ERROR: ONNX export does not match the pickle; not saved")
+        return False
+    onnx.save(onnx_model, path)
+    print(f"ONNX model saved: {path} ({os.path.getsize(path) / 1024:.1f} KB)")
+    return True
+
+# Export an already trained model without retraining:
+#   python heart_disease_training.py --export-only [model.pkl] [model.onnx]
+if len(sys.argv) > 1 and sys.argv[1] == "--export-only":
+    pkl_path = sys.argv[2] if len(sys.argv) > 2 else MODEL_SAVE_PATH
+    onnx_path = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(pkl_path)[0] + ".onnx"
+    trained = joblib.load(pkl_path)
+    ok = export_onnx(trained, np.empty((0, trained.n_features_in_)), onnx_path)
+    sys.exit(0 if ok else 1)
 
 print("Process Started...")
 
@@ -100,3 +237,5 @@ os.makedirs(os.path.dirname(MODEL_SAVE_PATH), exist_ok=True)
 joblib.dump(model, MODEL_SAVE_PATH)
 print(f"\nModel Saved Successfully!")
 print(f"   Location: {MODEL_SAVE_PATH}")
+
+export_onnx(model, X_test.values)
@@ -247,21 +247,71 @@ onnx_model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_cl
 onnx_model.load_state_dict(torch.load(MODEL_PATH, map_location='cpu'))
 onnx_model.eval()
 
+# 3. Grad-CAM outputs: same target layer as STEP 11 (blocks[-1]).
+# Besides the logits, the graph returns
+#   features    - blocks[-1] activations, (B, 576, 7, 7)
+#   cam_weights - d logit_c / d pooled feature k, (B, num_classes, 576)
+# Grad-CAM's channel weights are the spatial mean of d logit / d features,
+# which (global average pooling being linear) is cam_weights / (H * W), so
+# the server builds the CAM as ReLU(sum_k w_ck * A_k) without autograd.
+class PneumoniaCAMExport(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        m = self.model
+        features = m.forward_features(x)
+        pooled = m.global_pool(features)
+        head = m.norm_head(m.conv_head(pooled)).flatten(1) if hasattr(m, 'norm_head') else m.conv_head(pooled).flatten(1)
+        logits = m.classifier(m.act2(head))
+
+        # Hard-swish derivative: 0 below -3, 1 above 3, (2x + 3) / 6 in between
+        d_act = torch.where(head < -3, torch.zeros_like(head),
+                            torch.where(head > 3, torch.ones_like(head), (2 * head + 3) / 6))
+        w_head = m.conv_head.weight.flatten(1)  # (1024, 576)
+        cam_weights = torch.einsum('cm,bm,mk->bck', m.classifier.weight, d_act, w_head)
+        return logits, features, cam_weights
+
+cam_export = PneumoniaCAMExport(onnx_model).eval()
+
 dummy_input = torch.randn(1, 3, 224, 224)
 
-# 3. ONNX mein convert karein
+# Sanity check: cam_weights must match autograd (what pytorch_grad_cam uses)
+check_input = dummy_input.clone()
+with torch.no_grad():
+    ref_logits, ref_features, ref_weights = cam_export(check_input)
+feats = ref_features.clone().requires_grad_(True)
+head_out = onnx_model.forward_head(feats)
+grad = torch.autograd.grad(head_out[0, 0], feats)[0]
+grad_weights = grad.sum(dim=(2, 3))[0]
+assert torch.allclose(grad_weights, ref_weights[0, 0], atol=1e-4), "cam_weights do not match autograd"
+
+# 4. ONNX mein convert karein
 torch.onnx.export(
-    onnx_model,
+    cam_export,
     dummy_input,
     ONNX_PATH,
     export_params=True,
     opset_version=18,  # <--- SIRF YAHI CHANGE KIYA HAI (14 se 18)
     input_names=['input'],
-    output_names=['output'],
-    dynamic_axes={'input': {0: 'batch_size'}, 'output': {0: 'batch_size'}}
+    output_names=['output', 'features', 'cam_weights'],
+    dynamic_axes={
+        'input': {0: 'batch_size'},
+        'output': {0: 'batch_size'},
+        'features': {0: 'batch_size'},
+        'cam_weights': {0: 'batch_size'}
+    }
 )
 print(f" ONNX model saved successfully for Production: {ONNX_PATH}")
 
+# 5. (Optional) Preprocessing ko graph mein fold karein: the served model then
+# takes raw uint8 (N, 224, 224, 3) pixels instead of normalized float32 NCHW,
+# and the export checks parity with the server's Python preprocessing.
+# Copy the model to backend/app/models, then from backend/:
+#   python convert_to_onnx.py --fold-preprocessing --model app/models/pneumonia_model.onnx
+#   EDDS_LUNG_MODEL_FILE=pneumonia_model.uint8.onnx
+
 #  STEP 11: TEST THE MODEL WITH GRAD-CAM
 import torch.nn.functional as F
 from pytorch_grad_cam import GradCAM